@@ -0,0 +1,113 @@
+"""Benchmark the class scoped failure detection on failures with very large tracebacks.
+
+The legacy detection rendered ``report.longreprtext`` and searched it with a regex; the current one walks the raw
+traceback frames looking for class scoped fixtures code. Both are measured on the very same reports.
+
+Usage: ``python benchmarks/bench_class_scope_detection.py [--tests N] [--depth N]``
+"""
+
+import argparse
+import re
+import tempfile
+import textwrap
+import time
+from pathlib import Path
+from typing import Any, Dict, Generator, List
+
+import pytest
+
+from pytest_vcr_delete_on_fail.main import has_scoped_phase_failed
+
+
+def legacy_has_class_scoped_phase_failed(report: Any) -> bool:
+    """The regex based detection used before the structured one."""
+    if len(report.longreprtext) > 0:
+        pattern = re.compile(
+            r"(@pytest\.fixture\()(.*)(scope *= *)([\"\'])(class)([\"\'])(.*)(\))"
+        )
+        found = pattern.search(report.longreprtext)
+        if found:
+            return True
+    return False
+
+
+class DetectionTimer:
+    """Plugin timing both detections on every setup/teardown report."""
+
+    def __init__(self) -> None:
+        self.timings: Dict[str, List[float]] = {"legacy": [], "structured": []}
+        self.longrepr_sizes: List[int] = []
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(
+        self, item: Any, call: Any
+    ) -> Generator[None, Any, None]:
+        outcome = yield
+        rep = outcome.get_result()
+        if rep.when == "call":
+            return
+
+        start = time.perf_counter()
+        legacy = legacy_has_class_scoped_phase_failed(rep)
+        self.timings["legacy"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        structured = has_scoped_phase_failed(item, call)
+        self.timings["structured"].append(time.perf_counter() - start)
+
+        assert legacy == structured
+        if rep.failed:
+            self.longrepr_sizes.append(len(rep.longreprtext))
+
+
+def make_test_file(folder: Path, tests: int, depth: int) -> Path:
+    """Write a test class whose class scoped fixture fails deep into a recursion with bulky locals."""
+    methods = "\n".join(
+        f"    def test_{i}(self):\n        pass\n" for i in range(tests)
+    )
+    source = textwrap.dedent(f"""
+        import pytest
+
+        def recurse(n, payload):
+            if n == 0:
+                raise ValueError("deep failure")
+            padding = payload * 2
+            return recurse(n - 1, payload)
+
+        class TestDeep:
+            @pytest.fixture(scope="class", autouse=True)
+            def setup_phase(self):
+                recurse({depth}, "x" * 512)
+        """)
+    test_file = folder / "test_deep.py"
+    test_file.write_text(source + methods)
+    return test_file
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tests", type=int, default=50)
+    parser.add_argument("--depth", type=int, default=200)
+    args = parser.parse_args()
+
+    timer = DetectionTimer()
+    with tempfile.TemporaryDirectory() as folder:
+        test_file = make_test_file(Path(folder), args.tests, args.depth)
+        pytest.main(
+            [str(test_file), "-q", "-p", "no:cacheprovider", "--showlocals"],
+            plugins=[timer],
+        )
+
+    average_size = sum(timer.longrepr_sizes) / max(len(timer.longrepr_sizes), 1)
+    print(
+        f"\nreports: {len(timer.timings['legacy'])}, average failed longrepr: {average_size / 1024:.0f} KiB"
+    )
+    for name, timings in timer.timings.items():
+        total = sum(timings)
+        print(
+            f"{name:>10}: total {total * 1000:9.2f} ms, per report {total / len(timings) * 1e6:10.1f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Measure the per-item overhead of the plugin hooks on a synthetic session.
+
+Every plugin hook is wrapped with a timer before pytest registers the plugin, then a generated test module is run
+in-process. Only the time spent inside the plugin hooks is accounted for.
+
+Usage: ``python benchmarks/bench_hook_overhead.py [--items N] [--marked-ratio R]``
+"""
+
+import argparse
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from instrumentation import instrument_plugin, plugin_hooks
+
+
+def make_test_file(folder: Path, items: int, marked_ratio: float) -> Path:
+    """Write a test module with `items` passing tests, a fraction of them marked with the plugin marker."""
+    marked_every = int(1 / marked_ratio) if marked_ratio > 0 else 0
+    lines = ["import pytest", ""]
+    for i in range(items):
+        if marked_every and i % marked_every == 0:
+            lines.append("@pytest.mark.vcr_delete_on_fail")
+        lines.append(f"def test_{i}():\n    pass\n")
+    test_file = folder / "test_overhead.py"
+    test_file.write_text("\n".join(lines))
+    return test_file
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--marked-ratio", type=float, default=0.0)
+    args = parser.parse_args()
+
+    measures = instrument_plugin(plugin_hooks())
+    with tempfile.TemporaryDirectory() as folder:
+        test_file = make_test_file(Path(folder), args.items, args.marked_ratio)
+        pytest.main([str(test_file), "-q", "-p", "no:cacheprovider"])
+
+    print(f"\nitems: {args.items}, marked ratio: {args.marked_ratio}")
+    total = 0.0
+    for name, measure in measures.items():
+        total += measure.total
+        print(
+            f"{name:>30}: calls {measure.calls:7d}, total {measure.total * 1000:9.2f} ms"
+        )
+    print(f"{'per item overhead':>30}: {total / args.items * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Measure time and peak memory of pruning a very large yaml cassette.
+
+A synthetic cassette made of interactions with binary bodies is written in the format used by vcrpy, then pruned
+keeping half of its interactions with the streaming rewrite used by the plugin. With ``--in-memory`` the same is done by
+loading and saving the cassette again through vcrpy, for comparison (this can take a long time on big cassettes).
+
+Usage: ``python benchmarks/bench_prune_large_cassette.py [--size-mb 300] [--body-kb 256] [--in-memory]``
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+
+from vcr.persisters.filesystem import FilesystemPersister
+from vcr.request import Request
+from vcr.serialize import serialize
+from vcr.serializers import yamlserializer
+
+from pytest_vcr_delete_on_fail.main import prune_yaml_cassette_file
+
+
+def interaction_template(body_kb: int) -> str:
+    """Return the yaml of a single interaction with a binary body, as vcrpy would write it."""
+    body = os.urandom(body_kb * 1024)
+    serialized: str = serialize(
+        {
+            "requests": [Request("POST", "http://localhost/URI", body, {})],
+            "responses": [
+                {
+                    "status": {"code": 200, "message": "OK"},
+                    "headers": {},
+                    "body": {"string": body},
+                }
+            ],
+        },
+        yamlserializer,
+    )
+    start = serialized.index("\n- ") + 1
+    end = serialized.index("\nversion:") + 1
+    return serialized[start:end]
+
+
+def write_cassette(path: str, size_mb: int, body_kb: int) -> int:
+    """Write a cassette of about `size_mb` MB, returning the number of its interactions."""
+    template = interaction_template(body_kb)
+    count = max(size_mb * 1024 * 1024 // len(template), 2)
+    with open(path, "w") as f:
+        f.write("interactions:\n")
+        for i in range(count):
+            f.write(template.replace("http://localhost/URI", f"http://localhost/{i}"))
+        f.write("version: 1\n")
+    return count
+
+
+def measure(label: str, func: Callable[[], None]) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:>10}: {elapsed:8.2f} s, peak memory {peak / 1024 / 1024:8.1f} MB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=300)
+    parser.add_argument("--body-kb", type=int, default=256)
+    parser.add_argument("--in-memory", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "cassette.yaml")
+        count = write_cassette(path, args.size_mb, args.body_kb)
+        size = os.path.getsize(path) / 1024 / 1024
+        print(f"cassette: {size:.1f} MB, {count} interactions, keeping {count // 2}")
+
+        measure("streaming", lambda: prune_yaml_cassette_file(path, count // 2))
+        print(f"{'pruned':>10}: {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+        if args.in_memory:
+            count = write_cassette(path, args.size_mb, args.body_kb)
+
+            def in_memory() -> None:
+                requests, responses = FilesystemPersister.load_cassette(
+                    path, serializer=yamlserializer
+                )
+                FilesystemPersister.save_cassette(
+                    path,
+                    {
+                        "requests": requests[: count // 2],
+                        "responses": responses[: count // 2],
+                    },
+                    serializer=yamlserializer,
+                )
+
+            measure("in memory", in_memory)
+
+
+if __name__ == "__main__":
+    main()
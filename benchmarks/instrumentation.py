@@ -0,0 +1,97 @@
+"""Helpers shared by the benchmarks to measure the time (and memory) spent inside the plugin code.
+
+Plugin functions are replaced with instrumented versions before pytest registers the plugin, so this module must be
+used before calling ``pytest.main``.
+"""
+
+import functools
+import inspect
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+import pytest_vcr_delete_on_fail.main as plugin
+
+
+class Measure:
+    """Time and memory spent by a single instrumented function."""
+
+    def __init__(self) -> None:
+        self.timings: List[float] = []
+        # net memory still allocated when the function returns, as seen by tracemalloc (when tracing)
+        self.retained_bytes = 0
+
+    @property
+    def calls(self) -> int:
+        return len(self.timings)
+
+    @property
+    def total(self) -> float:
+        return sum(self.timings)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "total_s": self.total,
+            "retained_bytes": self.retained_bytes,
+        }
+
+
+def _memory() -> int:
+    return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+
+def timed(func: Callable[..., Any], measure: Measure) -> Callable[..., Any]:
+    """Wrap a function (hookwrappers included) so that the time spent inside it is recorded."""
+    if inspect.isgeneratorfunction(func):
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            memory = _memory()
+            start = time.perf_counter()
+            gen = func(*args, **kwargs)
+            next(gen)
+            elapsed = time.perf_counter() - start
+            outcome = yield
+            # what happens in between belongs to other hooks
+            memory_before_resume = _memory()
+            start = time.perf_counter()
+            try:
+                gen.send(outcome)
+            except StopIteration:
+                pass
+            measure.timings.append(elapsed + time.perf_counter() - start)
+            measure.retained_bytes += _memory() - memory_before_resume
+            del memory
+
+        return wrapper
+
+    @functools.wraps(func)
+    def plain_wrapper(*args: Any, **kwargs: Any) -> Any:
+        memory = _memory()
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            measure.timings.append(time.perf_counter() - start)
+            measure.retained_bytes += _memory() - memory
+
+    return plain_wrapper
+
+
+def instrument_plugin(names: List[str]) -> Dict[str, Measure]:
+    """Replace the named plugin functions with instrumented versions, returning their measures."""
+    measures: Dict[str, Measure] = {}
+    for name in names:
+        measures[name] = Measure()
+        setattr(plugin, name, timed(getattr(plugin, name), measures[name]))
+    return measures
+
+
+def plugin_hooks() -> List[str]:
+    """Return the names of the plugin hooks called while collecting and running tests."""
+    return [
+        name
+        for name in dir(plugin)
+        if name.startswith("pytest_runtest_") or name == "pytest_collection_modifyitems"
+    ]
@@ -0,0 +1,240 @@
+"""Benchmark suite for the plugin hooks overhead.
+
+Synthetic sessions of different sizes and marker layouts are run in-process (one subprocess per case, for isolation),
+measuring the time spent inside the plugin hooks and ``get_cassettes``. With ``--allocations`` the memory allocated
+and retained by the plugin is measured as well (tracemalloc slows everything down, so timings are less meaningful).
+
+Results are stored in ``benchmarks/results/<label>.json`` (the label defaults to the current git commit), so that they
+can be compared across commits:
+
+    python benchmarks/suite.py --sizes 1000,10000
+    python benchmarks/suite.py --sizes 1000,10000 --compare benchmarks/results/<other>.json
+
+Layouts:
+
+- ``none``: passing tests without the marker
+- ``module``: failing tests with a module level marker
+- ``callables``: failing tests with a module level marker targeting nested callables
+- ``class_fixture``: test classes with a marker, failing at a class scoped fixture setup
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+HERE = Path(__file__).parent
+RESULTS = HERE / "results"
+TESTS_PER_FILE = 1000
+MEASURED = [
+    "pytest_collection_modifyitems",
+    "pytest_runtest_makereport",
+    "pytest_runtest_protocol",
+    "get_cassettes",
+]
+
+
+def plain_tests(count: int) -> str:
+    return "\n".join(f"def test_{i}():\n    pass\n" for i in range(count))
+
+
+def failing_tests(count: int) -> str:
+    return "\n".join(f"def test_{i}():\n    assert False\n" for i in range(count))
+
+
+def none_layout(count: int) -> str:
+    return plain_tests(count)
+
+
+def module_layout(count: int) -> str:
+    header = "import pytest\n\npytestmark = pytest.mark.vcr_delete_on_fail\n\n"
+    return header + failing_tests(count)
+
+
+def callables_layout(count: int) -> str:
+    header = textwrap.dedent("""
+        import pytest
+
+        def first(item):
+            return [f"{item.name}.a", second]
+
+        def second(item):
+            return [f"{item.name}.b", None]
+
+        pytestmark = pytest.mark.vcr_delete_on_fail.with_args([first, ["static.yaml", [second]]])
+
+        """)
+    return header + failing_tests(count)
+
+
+def class_fixture_layout(count: int) -> str:
+    classes = []
+    per_class = 10
+    for c in range(0, count, per_class):
+        methods = "".join(
+            f"    def test_{i}(self):\n        pass\n\n"
+            for i in range(min(per_class, count - c))
+        )
+        classes.append(
+            f"@pytest.mark.vcr_delete_on_fail\nclass TestClass{c}:\n"
+            f"    @pytest.fixture(scope='class', autouse=True)\n"
+            f"    def setup_phase(self):\n        raise Exception\n\n{methods}"
+        )
+    return "import pytest\n\n" + "\n".join(classes)
+
+
+LAYOUTS: Dict[str, Callable[[int], str]] = {
+    "none": none_layout,
+    "module": module_layout,
+    "callables": callables_layout,
+    "class_fixture": class_fixture_layout,
+}
+
+
+def write_session(folder: Path, layout: str, size: int) -> None:
+    """Write `size` tests with the chosen layout, split in files of TESTS_PER_FILE tests."""
+    for index, start in enumerate(range(0, size, TESTS_PER_FILE)):
+        count = min(TESTS_PER_FILE, size - start)
+        (folder / f"test_bench_{index}.py").write_text(LAYOUTS[layout](count))
+
+
+def run_case(layout: str, size: int, allocations: bool) -> Dict[str, Any]:
+    """Run a single case in this process and return its measures."""
+    import pytest
+    import pytest_vcr_delete_on_fail.main as plugin
+    from instrumentation import instrument_plugin
+
+    measures = instrument_plugin(MEASURED)
+    if allocations:
+        tracemalloc.start()
+
+    with tempfile.TemporaryDirectory() as folder:
+        write_session(Path(folder), layout, size)
+        start = time.perf_counter()
+        pytest.main(
+            [folder, "-qq", "--tb=no", "-p", "no:cacheprovider", "-p", "no:randomly"]
+        )
+        wall = time.perf_counter() - start
+
+    result: Dict[str, Any] = {
+        "layout": layout,
+        "size": size,
+        "wall_s": wall,
+        "functions": {name: measure.as_dict() for name, measure in measures.items()},
+    }
+    if allocations:
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(True, plugin.__file__)]
+        )
+        stats = snapshot.statistics("filename")
+        result["plugin_retained_bytes"] = sum(stat.size for stat in stats)
+        result["plugin_retained_blocks"] = sum(stat.count for stat in stats)
+        tracemalloc.stop()
+    return result
+
+
+def current_label() -> str:
+    """Return the current short git commit, or a timestamp outside of a git repository."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return time.strftime("%Y%m%d-%H%M%S")
+
+
+def print_results(results: List[Dict[str, Any]], baseline: Dict[str, Any]) -> None:
+    """Print the results table, comparing them with the baseline ones if available."""
+    base_cases = {(r["layout"], r["size"]): r for r in baseline.get("cases", [])}
+    for case in results:
+        base = base_cases.get((case["layout"], case["size"]))
+        print(f"\n{case['layout']} x {case['size']}: wall {case['wall_s']:.2f} s")
+        for name, measure in case["functions"].items():
+            line = (
+                f"  {name:>30}: calls {measure['calls']:7d}, total {measure['total_s'] * 1000:10.2f} ms,"
+                f" per item {measure['total_s'] / case['size'] * 1e6:8.2f} us"
+            )
+            if measure["retained_bytes"]:
+                line += f", retained {measure['retained_bytes'] / 1024:9.1f} KiB"
+            if base and base["functions"].get(name, {}).get("total_s"):
+                ratio = measure["total_s"] / base["functions"][name]["total_s"]
+                line += f"  ({ratio:.2f}x baseline)"
+            print(line)
+        if "plugin_retained_bytes" in case:
+            print(
+                f"  {'allocated by plugin code':>30}: {case['plugin_retained_bytes'] / 1024:.1f} KiB"
+                f" in {case['plugin_retained_blocks']} blocks still alive at session end"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--sizes", default="1000,10000", help="comma separated sizes")
+    parser.add_argument(
+        "--layouts", default=",".join(LAYOUTS), help="comma separated layouts"
+    )
+    parser.add_argument("--allocations", action="store_true")
+    parser.add_argument("--label", default=None, help="results file name")
+    parser.add_argument("--compare", default=None, help="a previous results file")
+    parser.add_argument("--run-case", nargs=2, metavar=("LAYOUT", "SIZE"))
+    parser.add_argument("--output", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        # child process: run a single case and write its result
+        result = run_case(args.run_case[0], int(args.run_case[1]), args.allocations)
+        Path(args.output).write_text(json.dumps(result))
+        return
+
+    results = []
+    for layout in args.layouts.split(","):
+        for size in [int(size) for size in args.sizes.split(",")]:
+            print(f"running {layout} x {size}...", flush=True)
+            with tempfile.NamedTemporaryFile(suffix=".json") as output:
+                command = [
+                    sys.executable,
+                    __file__,
+                    "--run-case",
+                    layout,
+                    str(size),
+                    "--output",
+                    output.name,
+                ]
+                if args.allocations:
+                    command.append("--allocations")
+                subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+                results.append(json.loads(Path(output.name).read_text()))
+
+    label = args.label or current_label()
+    RESULTS.mkdir(exist_ok=True)
+    results_file = RESULTS / f"{label}{'-allocations' if args.allocations else ''}.json"
+    results_file.write_text(
+        json.dumps(
+            {
+                "label": label,
+                "python": platform.python_version(),
+                "allocations": args.allocations,
+                "cases": results,
+            },
+            indent=2,
+        )
+    )
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else {}
+    print_results(results, baseline)
+    print(f"\nresults stored in {os.path.relpath(results_file)}")
+
+
+if __name__ == "__main__":
+    main()
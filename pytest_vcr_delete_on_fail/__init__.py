@@ -1,8 +1,21 @@
 from pytest_vcr_delete_on_fail.main import (
     get_default_cassette_path,
+    get_default_cassette_dir,
     has_class_scoped_setup_failed,
     has_class_scoped_teardown_failed,
+    has_module_scoped_setup_failed,
+    has_module_scoped_teardown_failed,
+    has_session_scoped_setup_failed,
+    has_session_scoped_teardown_failed,
     delete_on_fail,
     vcr_and_dof,
+    async_delete_on_fail,
+    async_vcr_and_dof,
     ValidTarget,
+    get_cassette_index,
+    CassetteIndex,
+    CassetteEntry,
+    TargetCallableWarning,
+    Glob,
+    Regex,
 )
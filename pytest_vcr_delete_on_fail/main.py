@@ -1,87 +1,1123 @@
+import asyncio
+import errno
+import fnmatch
+import json
 import os
 import pytest
+import queue
 import re
+import shutil
+import tempfile
+import threading
+import time
 
-from contextlib import contextmanager
-from typing import Optional, Set, Dict, Any, List, Union, Callable, Generator, TypeVar
+from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from contextlib import contextmanager, asynccontextmanager
+from typing import (
+    Optional,
+    Set,
+    Dict,
+    Any,
+    List,
+    Union,
+    Callable,
+    Generator,
+    AsyncGenerator,
+    TypeVar,
+    Iterable,
+    Tuple,
+    NamedTuple,
+    Type,
+)
+from types import CodeType, TracebackType
+from vcr.cassette import Cassette
 from vcr.config import VCR
+from vcr.persisters.filesystem import FilesystemPersister
+from vcr.serializers import yamlserializer
 
 from _pytest.mark import Mark
 from _pytest.reports import TestReport
 from _pytest.runner import CallInfo
 from _pytest.python import Function
 from _pytest.config import Config
+from _pytest.config.argparsing import Parser
+from _pytest.main import Session, wrap_session
+from _pytest.fixtures import FixtureDef
+from _pytest.nodes import Node
 
 marker_name = "vcr_delete_on_fail"
 target_str = "target"
 delete_default_str = "delete_default"
 skip_str = "skip"
+prune_str = "prune"
+scope_str = "scope"
+delete_default_dir_str = "delete_default_dir"
+min_failures_str = "min_failures"
+# the target meaning: the cassettes the test actually opened
+auto_target = "auto"
+
+deferred_option = "vcr_dof_deferred"
+# the key used by pytest-xdist workers to send the cassettes to delete to the controller
+xdist_workeroutput_key = "vcr_dof_pending_deletions"
+index_option = "vcr_dof_index"
+quarantine_option = "vcr_dof_quarantine"
+quarantine_dir_option = "vcr_dof_quarantine_dir"
+restore_option = "vcr_dof_restore"
+purge_option = "vcr_dof_purge_quarantine"
+prune_option = "vcr_dof_prune"
+rerun_deleted_option = "vcr_dof_rerun_deleted"
+# the config.cache key of the manifest of the deleted cassettes: {cassette path: [node ids of its tests]}
+manifest_cache_key = "vcr_delete_on_fail/deleted"
+target_workers_option = "vcr_dof_target_workers"
+target_timeout_option = "vcr_dof_target_timeout"
+background_workers_option = "vcr_dof_background_workers"
+min_failures_option = "vcr_dof_min_failures"
+# the config.cache key of the failure counters: {cassette path: {"failures": count, "tests": [node ids]}}
+failures_cache_key = "vcr_delete_on_fail/failures"
+# the key used by pytest-xdist workers to send their failure counters changes to the controller
+xdist_failures_key = "vcr_dof_failures"
+budget_option = "vcr_dof_budget"
+# the config.cache key of the re-record costs: {cassette path: {"size": bytes, "interactions": count, "recording": s}}
+costs_cache_key = "vcr_delete_on_fail/costs"
+# the key used by pytest-xdist workers to send the durations of the tests recording cassettes again to the controller
+xdist_costs_key = "vcr_dof_recording_durations"
+# how many cassettes are listed in the re-record budget
+budget_listed_cassettes = 10
+# how many deletions each background worker can have waiting before the tests are slowed down to let it catch up
+background_queue_size_per_worker = 16
+timings_option = "vcr_dof_timings"
+timings_json_option = "vcr_dof_timings_json"
+# the key used by pytest-xdist workers to send their timings to the controller
+xdist_timings_key = "vcr_dof_timings"
+# timing categories other than the plugin hooks
+target_callables_category = "target callables"
+deletion_category = "cassette deletion"
+# fixture scopes, from the narrowest to the widest
+scopes_order = ("function", "class", "module", "package", "session")
+# the fixture scopes whose failures are tracked, and that can be used by the marker scope argument
+fixture_scopes = ("class", "module", "session")
+
+
+#
+# CASSETTE INDEX
+#
+class CassetteEntry(NamedTuple):
+    """A cassette file found by the CassetteIndex."""
+
+    path: str
+    size: int
+    mtime: float
+
+
+class CassetteIndex:
+    """In-memory index of cassette files. Every folder is listed (with a single os.scandir) the first time it's needed,
+    then every lookup is answered from memory.
+
+    The index is a snapshot: it's kept up to date with the deletions performed by the plugin, but files written by
+    someone else after a folder has been listed are only seen after a `refresh` of that path or a new `scan`.
+    """
+
+    def __init__(self) -> None:
+        # absolute folder path -> file name -> entry
+        self._folders: Dict[str, Dict[str, CassetteEntry]] = {}
+        # absolute folder path -> names of the sub-folders (cassette directories, or folders holding cassettes)
+        self._subfolders: Dict[str, Set[str]] = {}
+        # absolute folder path -> folder modification time when it was listed (None if it did not exist)
+        self._mtimes: Dict[str, Optional[int]] = {}
+
+    def scan(self, folder: str, recursive: bool = True) -> None:
+        """List the folder (and, if recursive, all of its sub-folders) replacing what was known about it."""
+        to_scan = [os.path.abspath(folder)]
+        while to_scan:
+            current = to_scan.pop()
+            entries: Dict[str, CassetteEntry] = {}
+            subfolders: Set[str] = set()
+            # taken before listing: a file added meanwhile will change the folder mtime again
+            self._mtimes[current] = get_folder_mtime(current)
+            try:
+                with os.scandir(current) as iterator:
+                    for entry in iterator:
+                        if entry.is_dir():
+                            subfolders.add(entry.name)
+                            if recursive:
+                                to_scan.append(entry.path)
+                        else:
+                            stat = entry.stat()
+                            entries[entry.name] = CassetteEntry(
+                                entry.path, stat.st_size, stat.st_mtime
+                            )
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+            self._folders[current] = entries
+            self._subfolders[current] = subfolders
+
+    def listdir(self, folder: str, revalidate: bool = False) -> List[CassetteEntry]:
+        """Return the cassettes found directly inside the folder. If revalidate is True, the folder is listed again
+        when its modification time has changed since the last listing (which costs a single os.stat otherwise).
+        """
+        folder = os.path.abspath(folder)
+        if revalidate:
+            self._revalidate(folder)
+        return list(self._get_folder(folder).values())
+
+    def get(
+        self, cassette_path: str, revalidate: bool = False
+    ) -> Optional[CassetteEntry]:
+        """Return the index entry of the cassette file, or None if it's not there. See listdir for revalidate."""
+        folder, name = os.path.split(os.path.abspath(cassette_path))
+        if revalidate:
+            self._revalidate(folder)
+        return self._get_folder(folder).get(name)
+
+    def exists(self, cassette_path: str, revalidate: bool = False) -> bool:
+        """Return True if the cassette (file or directory) is in the index. See listdir for revalidate."""
+        folder, name = os.path.split(os.path.abspath(cassette_path))
+        if revalidate:
+            self._revalidate(folder)
+        return name in self._get_folder(folder) or name in self._subfolders[folder]
+
+    def refresh(self, cassette_path: str) -> Optional[CassetteEntry]:
+        """Check the cassette on disk again, updating the index. Return its new entry, if any."""
+        folder, name = os.path.split(os.path.abspath(cassette_path))
+        entries = self._get_folder(folder)
+        try:
+            stat = os.stat(os.path.join(folder, name))
+        except (FileNotFoundError, NotADirectoryError):
+            entries.pop(name, None)
+            return None
+        entries[name] = CassetteEntry(
+            os.path.join(folder, name), stat.st_size, stat.st_mtime
+        )
+        return entries[name]
+
+    def discard(self, cassette_path: str) -> None:
+        """Remove the cassette from the index. If it's a cassette directory, everything known inside it is removed as
+        well."""
+        path = os.path.abspath(cassette_path)
+        folder, name = os.path.split(path)
+        folder_entries = self._folders.get(folder)
+        if folder_entries is not None:
+            folder_entries.pop(name, None)
+            self._subfolders[folder].discard(name)
+        if path in self._folders:
+            prefix = os.path.join(path, "")
+            for known in [
+                f for f in self._folders if f == path or f.startswith(prefix)
+            ]:
+                self._folders[known] = {}
+                self._subfolders[known] = set()
+                self._mtimes[known] = None
+
+    def _revalidate(self, folder: str) -> None:
+        """List the folder again if its modification time changed since the last listing."""
+        if self._mtimes.get(folder, -1) != get_folder_mtime(folder):
+            self.scan(folder, recursive=False)
+
+    def _get_folder(self, folder: str) -> Dict[str, CassetteEntry]:
+        """Return the known folder entries, listing the folder if it was never listed before."""
+        entries = self._folders.get(folder)
+        if entries is None:
+            self.scan(folder, recursive=False)
+            entries = self._folders[folder]
+        return entries
+
+
+def get_folder_mtime(folder: str) -> Optional[int]:
+    """Return the folder modification time in nanoseconds, or None if it does not exist."""
+    try:
+        return os.stat(folder).st_mtime_ns
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+#
+# QUARANTINE
+#
+class Quarantine:
+    """A per-session folder where cassettes are moved instead of being deleted, so that they can be restored later.
+
+    Cassettes keep their path relative to the rootdir inside the ``rootdir`` sub-folder; cassettes outside the rootdir
+    keep their absolute path inside the ``absolute`` sub-folder."""
+
+    def __init__(self, root: str, rootdir: str) -> None:
+        self.root = root
+        self.rootdir = rootdir
+        self.folder = os.path.join(
+            root, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        )
+        self._created_folders: Set[str] = set()
+
+    def get_destination(self, cassette_path: str) -> str:
+        """Return where the cassette will be moved inside the session folder."""
+        relative = os.path.relpath(cassette_path, self.rootdir)
+        if relative.startswith(os.pardir):
+            stripped = os.path.splitdrive(cassette_path)[1].lstrip(os.sep)
+            return os.path.join(self.folder, "absolute", stripped)
+        return os.path.join(self.folder, "rootdir", relative)
+
+    def move(self, cassette_path: str) -> None:
+        """Move the cassette into the quarantine folder. Raise FileNotFoundError if the cassette does not exist."""
+        source = os.path.abspath(cassette_path)
+        destination = self.get_destination(source)
+        folder = os.path.dirname(destination)
+        if folder not in self._created_folders:
+            if not os.path.lexists(source):
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), source)
+            os.makedirs(folder, exist_ok=True)
+            self._created_folders.add(folder)
+        if os.path.isdir(destination) and is_plain_directory(source):
+            # the same directory has already been quarantined in this session
+            merge_directory(source, destination)
+            return
+        try:
+            os.rename(source, destination)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # the quarantine is on another filesystem: this can't be done with a rename
+            shutil.move(source, destination)
+
+
+def is_plain_directory(path: str) -> bool:
+    """Return True if the path is a directory, and not a symlink to one."""
+    return os.path.isdir(path) and not os.path.islink(path)
+
+
+def merge_directory(source: str, destination: str) -> None:
+    """Move the content of the source directory into the existing destination directory, replacing what's found in
+    both, then remove the source directory."""
+    for entry in list(os.scandir(source)):
+        target = os.path.join(destination, entry.name)
+        if entry.is_dir(follow_symlinks=False) and is_plain_directory(target):
+            merge_directory(entry.path, target)
+            continue
+        if is_plain_directory(target):
+            shutil.rmtree(target)
+        elif os.path.lexists(target):
+            os.remove(target)
+        shutil.move(entry.path, target)
+    os.rmdir(source)
+
+
+def list_quarantine_sessions(root: str) -> List[str]:
+    """Return the quarantine session folders names, from the oldest to the newest."""
+    try:
+        return sorted(
+            entry.name
+            for entry in os.scandir(root)
+            if entry.is_dir(follow_symlinks=False)
+        )
+    except FileNotFoundError:
+        return []
+
+
+def restore_quarantine_session(
+    root: str, rootdir: str, session: str
+) -> Tuple[List[str], List[str]]:
+    """Move the cassettes of a quarantine session back where they were. Cassettes that have been recorded again in the
+    meantime are left in quarantine. Return the restored and the skipped cassettes."""
+    restored: List[str] = []
+    skipped: List[str] = []
+    session_folder = os.path.join(root, session)
+    for base, prefix in [("rootdir", rootdir), ("absolute", os.sep)]:
+        base_folder = os.path.join(session_folder, base)
+        for folder, _, files in os.walk(base_folder):
+            for name in files:
+                quarantined = os.path.join(folder, name)
+                original = os.path.join(
+                    prefix, os.path.relpath(quarantined, base_folder)
+                )
+                if os.path.lexists(original):
+                    skipped.append(original)
+                    continue
+                os.makedirs(os.path.dirname(original), exist_ok=True)
+                shutil.move(quarantined, original)
+                restored.append(original)
+    if not skipped:
+        shutil.rmtree(session_folder, ignore_errors=True)
+    return restored, skipped
+
+
+def purge_quarantine(root: str, keep: Optional[str] = None) -> None:
+    """Delete every quarantine session folder, except the one to keep."""
+    for session in list_quarantine_sessions(root):
+        folder = os.path.join(root, session)
+        if folder != keep:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+#
+# TIMINGS
+#
+def percentile(values: List[float], percent: float) -> float:
+    """Return the nearest-rank percentile of the already sorted values."""
+    if not values:
+        return 0.0
+    rank = max(int(round(percent / 100 * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class Timings:
+    """Time spent by the plugin in its hooks, in target callables and in deleting cassettes.
+
+    Hook durations are also accumulated by test, to find the tests where the plugin spent the most time. Target
+    callables and deletions happen inside hooks, so they are part of the hooks durations as well.
+    """
+
+    def __init__(self) -> None:
+        # category -> every measured duration, in seconds
+        self.durations: Dict[str, List[float]] = {}
+        # test node id -> total time spent in the plugin hooks, in seconds
+        self.items: Dict[str, float] = {}
+
+    def add(self, category: str, duration: float, nodeid: Optional[str] = None) -> None:
+        """Record a duration, adding it to the test total if a node id is provided."""
+        self.durations.setdefault(category, []).append(duration)
+        if nodeid is not None:
+            self.items[nodeid] = self.items.get(nodeid, 0.0) + duration
+
+    def merge(self, data: Dict[str, Any]) -> None:
+        """Add the timings returned by `as_dict` (e.g. by a pytest-xdist worker)."""
+        for category, durations in data.get("durations", {}).items():
+            self.durations.setdefault(category, []).extend(durations)
+        for nodeid, duration in data.get("items", {}).items():
+            self.items[nodeid] = self.items.get(nodeid, 0.0) + duration
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return every recorded duration."""
+        return {"durations": self.durations, "items": self.items}
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Return count, total, p50, p99 and max duration of every category."""
+        summary = {}
+        for category, durations in self.durations.items():
+            ordered = sorted(durations)
+            summary[category] = {
+                "count": len(ordered),
+                "total": sum(ordered),
+                "p50": percentile(ordered, 50),
+                "p99": percentile(ordered, 99),
+                "max": ordered[-1],
+            }
+        return summary
+
+    def slowest_items(self, count: int) -> List[Tuple[str, float]]:
+        """Return the tests where the plugin spent the most time, with that time."""
+        return sorted(self.items.items(), key=lambda entry: entry[1], reverse=True)[
+            :count
+        ]
+
+
+T = TypeVar("T")
+
+
+def run_timed(
+    timings: Optional[Timings],
+    category: str,
+    nodeid: Optional[str],
+    func: Callable[..., T],
+    *args: Any,
+) -> T:
+    """Call the function with the provided arguments, recording its duration if timings are enabled."""
+    if timings is None:
+        return func(*args)
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        timings.add(category, time.perf_counter() - start, nodeid)
+
+
+#
+# TARGET EVALUATION
+#
+class TargetCallableWarning(pytest.PytestWarning):
+    """Warning issued when a target callable fails or times out: its cassettes will not be deleted."""
+
+
+# a target callable to call with a test item, with the future that will hold its result
+TargetTask = Tuple["Future[Any]", Callable[[Function], Any], Function]
+
+
+class TargetEvaluator:
+    """Call target callables, either serially or through a bounded pool of threads with a per-callable timeout.
+
+    The timeout of a callable starts when a worker picks it up, so callables queued behind slower ones are not
+    penalized. Worker threads are daemons and are started only when needed: a callable that never returns does not
+    keep the interpreter alive, it only keeps its worker busy. That worker is replaced, and leaves the pool as soon as
+    the callable returns.
+    """
+
+    def __init__(self, workers: int = 1, timeout: Optional[float] = None) -> None:
+        self.workers = max(workers, 1)
+        self.timeout = timeout
+        self._queue: "queue.SimpleQueue[Optional[TargetTask]]" = queue.SimpleQueue()
+        # the workers serving the queue: workers stuck in a callable that timed out are not among them
+        self._threads: List[threading.Thread] = []
+        # guards the threads list and the running callables
+        self._lock = threading.Lock()
+        # the callables being run, with the time they started and the worker running them
+        self._running: Dict["Future[Any]", Tuple[float, threading.Thread]] = {}
+        # the callables that timed out: their workers leave the pool once they return
+        self._abandoned: Set["Future[Any]"] = set()
+
+    @property
+    def serial(self) -> bool:
+        """True if callables are simply called one after the other, in the calling thread."""
+        return self.workers == 1 and self.timeout is None
+
+    def evaluate(
+        self, targets: List[Callable[[Function], Any]], item: Function
+    ) -> List[Tuple[Callable[[Function], Any], Any, Optional[str]]]:
+        """Call every target with the item. Return, in order, every target with its result and the reason it failed
+        (None if it did not)."""
+        results: List[Tuple[Callable[[Function], Any], Any, Optional[str]]] = []
+        if self.serial:
+            for target in targets:
+                try:
+                    results.append((target, target(item), None))
+                except (Exception,) as e:
+                    results.append((target, None, f"raised {e!r}"))
+            return results
+
+        futures = [(target, self._submit(target, item)) for target in targets]
+        pending = {future for _, future in futures}
+        timed_out: Set["Future[Any]"] = set()
+        while pending:
+            _, pending = wait(
+                pending,
+                timeout=self._next_deadline(pending),
+                return_when=FIRST_COMPLETED,
+            )
+            for future in list(pending):
+                if self._abandon_if_overrun(future):
+                    pending.discard(future)
+                    timed_out.add(future)
+        for target, future in futures:
+            if future in timed_out:
+                results.append((target, None, f"timed out after {self.timeout}s"))
+            elif future.exception() is not None:
+                results.append((target, None, f"raised {future.exception()!r}"))
+            else:
+                results.append((target, future.result(), None))
+        return results
+
+    def shutdown(self) -> None:
+        """Ask the idle workers to stop. Workers stuck in a callable are left behind."""
+        with self._lock:
+            for _ in self._threads:
+                self._queue.put(None)
+            self._threads = []
+
+    def _submit(
+        self, target: Callable[[Function], Any], item: Function
+    ) -> "Future[Any]":
+        future: "Future[Any]" = Future()
+        with self._lock:
+            if len(self._threads) < self.workers:
+                self._start_worker()
+        self._queue.put((future, target, item))
+        return future
+
+    def _start_worker(self) -> None:
+        thread = threading.Thread(target=self._work, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _next_deadline(self, pending: Set["Future[Any]"]) -> Optional[float]:
+        """Return how long to wait for the first of the pending callables to overrun its timeout. Callables still
+        queued have no deadline yet: if none is running, wait a whole timeout and check again.
+        """
+        if self.timeout is None:
+            return None
+        with self._lock:
+            started = [self._running[f][0] for f in pending if f in self._running]
+        if not started:
+            return self.timeout
+        return max(min(started) + self.timeout - time.monotonic(), 0.0)
+
+    def _abandon_if_overrun(self, future: "Future[Any]") -> bool:
+        """Abandon the callable if it's been running for longer than the timeout, replacing its worker. Return True
+        if it has been abandoned."""
+        if self.timeout is None:
+            return False
+        with self._lock:
+            running = self._running.get(future)
+            if running is None or future.done():
+                return False
+            started, thread = running
+            if time.monotonic() - started < self.timeout:
+                return False
+            self._abandoned.add(future)
+            if thread in self._threads:
+                self._threads.remove(thread)
+                self._start_worker()
+            return True
+
+    def _work(self) -> None:
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            future, target, item = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            with self._lock:
+                self._running[future] = (time.monotonic(), threading.current_thread())
+            try:
+                future.set_result(target(item))
+            except BaseException as e:
+                future.set_exception(e)
+            with self._lock:
+                del self._running[future]
+                if future in self._abandoned:
+                    # a replacement already took this worker place
+                    self._abandoned.discard(future)
+                    return
+
+
+#
+# BACKGROUND DELETION
+#
+DeletionTask = Tuple[str, Callable[..., Any], Tuple[Any, ...]]
+
+
+class DeletionWorker:
+    """Run cassette deletions in a pool of background threads, so that slow filesystems don't hold back the tests.
+
+    The queue is bounded: when the workers can't keep up, submitting a deletion blocks until there's room again.
+    Threads are daemons and are started only when needed. Errors are collected, to be reported at the end.
+    """
+
+    def __init__(self, workers: int, queue_size: Optional[int] = None) -> None:
+        self.workers = max(workers, 1)
+        self._queue: "queue.Queue[Optional[DeletionTask]]" = queue.Queue(
+            queue_size or self.workers * background_queue_size_per_worker
+        )
+        self._threads: List[threading.Thread] = []
+        # guards the session state updated by the deletions
+        self.lock = threading.Lock()
+        # every cassette whose deletion failed, with the reason
+        self.errors: List[Tuple[str, str]] = []
+
+    def submit(self, cassette_path: str, func: Callable[..., Any], *args: Any) -> None:
+        """Queue the deletion of the cassette, performed by calling the function with the provided arguments."""
+        if len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._queue.put((cassette_path, func, args))
+
+    def join(self) -> None:
+        """Wait for every queued deletion to be done, then stop the workers."""
+        self._queue.join()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _work(self) -> None:
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                cassette_path, func, args = task
+                try:
+                    func(*args)
+                except Exception as e:
+                    with self.lock:
+                        self.errors.append((cassette_path, repr(e)))
+            finally:
+                self._queue.task_done()
 
 
 #
-# CLASS STUBS
+# FAILURE COUNTERS
 #
-# These class stubs are used to trick type checking tools and IDEs to consider injected fields used by the plugin
-class TypesWithClsResult(type):
+class FailureCounters:
+    """The consecutive failures counted by every cassette, persisted across sessions in the pytest cache.
+
+    A cassette counts at most one failure per session, whatever the number of its failing tests. Its counter is reset
+    when it's deleted, or when a session runs one of the tests that failed it before and the test passes (unless the
+    cassette failed again in the same session).
+    """
+
+    def __init__(self, stored: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        # the counters left by the previous sessions: {cassette path: (failures, node ids of its failed tests)}
+        self.previous: Dict[str, Tuple[int, Set[str]]] = {
+            cassette: (int(counter["failures"]), set(counter["tests"]))
+            for cassette, counter in (stored or {}).items()
+        }
+        # the node ids of the tests that failed the cassettes counted so far
+        self.owners: Set[str] = {
+            owner for _, owners in self.previous.values() for owner in owners
+        }
+        # the cassettes that failed in this session without reaching their threshold, with the node ids of their tests
+        self.failed: Dict[str, Set[str]] = {}
+        # the cassettes that reached their threshold in this session
+        self.reached: Set[str] = set()
+        # the node ids of the tests (among the owners) that passed in this session
+        self.passed: Set[str] = set()
+
+    def count_failure(self, cassette_path: str, owner: str, threshold: int) -> bool:
+        """Count a failure of the (absolute) cassette path on behalf of the owner test. Return True if the cassette
+        reached the threshold, and should be deleted."""
+        if cassette_path in self.reached:
+            return True
+        failures = self.previous.get(cassette_path, (0, set()))[0] + 1
+        if failures >= threshold:
+            self.reached.add(cassette_path)
+            self.failed.pop(cassette_path, None)
+            return True
+        self.failed.setdefault(cassette_path, set()).add(owner)
+        return False
 
-    cls_setup_failed: bool
-    cls_teardown_failed: bool
+    def count_pass(self, nodeid: str) -> None:
+        """Record that the test passed: the cassettes it failed before will start counting again."""
+        if nodeid in self.owners:
+            self.passed.add(nodeid)
 
+    @property
+    def changed(self) -> bool:
+        """True if something happened in this session that must be stored."""
+        return bool(self.failed or self.reached or self.passed)
 
-class FunctionWithReports(Function):
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the changes of this session, to be merged by the pytest-xdist controller."""
+        return {
+            "failed": {
+                cassette: sorted(owners) for cassette, owners in self.failed.items()
+            },
+            "reached": sorted(self.reached),
+            "passed": sorted(self.passed),
+        }
 
-    reports: Dict[str, TestReport]
-    cls: TypesWithClsResult
+    def merge(self, data: Dict[str, Any]) -> None:
+        """Merge the changes sent by a pytest-xdist worker."""
+        self.reached.update(data["reached"])
+        for cassette, owners in data["failed"].items():
+            if cassette not in self.reached:
+                self.failed.setdefault(cassette, set()).update(owners)
+        for cassette in self.reached:
+            self.failed.pop(cassette, None)
+        self.passed.update(data["passed"])
+
+    def stored(self) -> Dict[str, Dict[str, Any]]:
+        """Return the counters to store for the next session."""
+        counters: Dict[str, Tuple[int, Set[str]]] = {
+            cassette: (failures, owners)
+            for cassette, (failures, owners) in self.previous.items()
+            if cassette not in self.reached and not owners & self.passed
+        }
+        for cassette, owners in self.failed.items():
+            failures, previous_owners = self.previous.get(cassette, (0, set()))
+            counters[cassette] = (failures + 1, previous_owners | owners)
+        return {
+            cassette: {"failures": failures, "tests": sorted(owners)}
+            for cassette, (failures, owners) in counters.items()
+        }
+
+
+#
+# RE-RECORD COSTS
+#
+class RecordingCosts:
+    """What it takes to record again the cassettes deleted by the plugin: their size, their interactions and, when a
+    previous session recorded them again, how long their tests took to do it. Costs are persisted across sessions in
+    the pytest cache.
+
+    The recording time is learned from the deletion manifest: when a cassette deleted by a previous session is found
+    again at the end of this one, the longest of its tests that passed in this session is the time it took to record it.
+    """
+
+    def __init__(
+        self,
+        stored: Optional[Dict[str, Dict[str, Any]]] = None,
+        missing: Optional[Dict[str, List[str]]] = None,
+    ) -> None:
+        # the costs known so far: {cassette path: {"size": bytes, "interactions": count, "recording": seconds}}
+        self.stored: Dict[str, Dict[str, Any]] = dict(stored or {})
+        # the cassettes deleted by previous sessions still missing when this one started, with their tests
+        self.missing: Dict[str, List[str]] = dict(missing or {})
+        self.tests: Set[str] = {
+            owner for owners in self.missing.values() for owner in owners
+        }
+        # the durations of the tests that passed in this session, among the ones of the missing cassettes
+        self.durations: Dict[str, float] = {}
+        # the costs of the cassettes deleted in this session
+        self.deleted: Dict[str, Dict[str, Any]] = {}
+
+    def add_test_duration(self, nodeid: str, duration: float) -> None:
+        """Record the duration of a passed test, if it could have recorded a missing cassette again."""
+        if nodeid in self.tests:
+            self.durations[nodeid] = duration
+
+    def add_deleted(
+        self, cassette_path: str, size: int, interactions: Optional[int]
+    ) -> None:
+        """Record the cost of a cassette deleted in this session."""
+        recording = self.stored.get(cassette_path, {}).get("recording")
+        self.deleted[cassette_path] = {
+            "size": size,
+            "interactions": interactions,
+            "recording": recording,
+        }
+
+    def update_recordings(self) -> None:
+        """Learn how long it took to record the missing cassettes found again on disk."""
+        for cassette, owners in self.missing.items():
+            durations = [
+                self.durations[owner] for owner in owners if owner in self.durations
+            ]
+            if durations and os.path.exists(cassette):
+                self.stored.setdefault(cassette, {})["recording"] = max(durations)
+
+    @property
+    def changed(self) -> bool:
+        """True if something happened in this session that must be stored."""
+        return bool(self.deleted or self.durations)
+
+    def as_stored(self) -> Dict[str, Dict[str, Any]]:
+        """Return the costs to store for the next sessions."""
+        return {**self.stored, **self.deleted}
+
+    def budget(self) -> Dict[str, Any]:
+        """Return the totals of the cassettes deleted in this session and the costliest ones: by recording time, then
+        interactions, then size."""
+        costs = self.deleted.values()
+        known = [cost["recording"] for cost in costs if cost["recording"] is not None]
+        return {
+            "cassettes": len(self.deleted),
+            "size": sum(cost["size"] for cost in costs),
+            "interactions": sum(cost["interactions"] or 0 for cost in costs),
+            "recording": sum(known),
+            "unknown": len(self.deleted) - len(known),
+            "costliest": sorted(
+                self.deleted.items(),
+                key=lambda entry: (
+                    entry[1]["recording"] or 0.0,
+                    entry[1]["interactions"] or 0,
+                    entry[1]["size"],
+                ),
+                reverse=True,
+            )[:budget_listed_cassettes],
+        }
+
+
+#
+# SESSION STATE
+#
+class SessionState:
+    """Plugin state shared by the whole test session. It's stored in the config stash, so that every session (even
+    in-process pytester ones) gets a fresh one."""
+
+    def __init__(
+        self,
+        deferred: bool = False,
+        xdist_worker: bool = False,
+        use_index: bool = False,
+        quarantine: Optional[Quarantine] = None,
+        timings: Optional[Timings] = None,
+        target_evaluator: Optional[TargetEvaluator] = None,
+        prune: bool = False,
+        deletion_worker: Optional[DeletionWorker] = None,
+        min_failures: int = 1,
+        costs: Optional[RecordingCosts] = None,
+    ) -> None:
+        # when deferred, cassettes are not deleted right after the test but collected and deleted in bulk at the end
+        self.deferred = deferred
+        # pytest-xdist workers never delete cassettes: they send them to the controller at the end of the session
+        self.xdist_worker = xdist_worker
+        # cassettes waiting to be deleted, with the node ids of the tests that targeted them
+        self.pending_deletions: Dict[str, Set[str]] = {}
+        # cassettes actually deleted (or quarantined) in this session, with the node ids of the tests that targeted them
+        self.deleted_cassettes: Dict[str, Set[str]] = {}
+        # for every scope and scope node id, the fixture names already inspected and the code objects of the ones
+        # with that scope
+        self.scoped_fixtures: Dict[Tuple[str, str], Tuple[Set[str], Set[CodeType]]] = {}
+        # for every scope and scope key (see get_scope_key), the phases ("setup", "teardown") failed because of a
+        # fixture with that scope
+        self.scoped_failures: Dict[Tuple[str, str], Set[str]] = {}
+        # the scoped markers already handled, by scope key and Mark identity: they delete their cassettes only once
+        self.scoped_deletions: Set[Tuple[str, int]] = set()
+        # parsed markers, by Mark identity: the Mark is kept as well so that its id can't be reused
+        self.parsed_marks: Dict[int, Tuple[Mark, "ParsedMark"]] = {}
+        self.cassette_index = CassetteIndex()
+        # when True, the index is built at the start of the session
+        self.use_index = use_index
+        # when set, cassettes are moved there instead of being deleted
+        self.quarantine = quarantine
+        self.purge_thread: Optional[threading.Thread] = None
+        # when set, the time spent by the plugin is measured
+        self.timings = timings
+        self.target_evaluator = target_evaluator or TargetEvaluator()
+        # when True, markers not saying otherwise prune their cassettes instead of deleting them
+        self.prune = prune
+        # while a test that may prune cassettes, or delete the ones it opened, is running: the cassettes it loaded, with
+        # their interactions count
+        self.loaded_cassettes: Optional[Dict[str, Tuple[int, Cassette]]] = None
+        # the vcrpy Cassette.load replaced to track the loaded cassettes, if it has been replaced
+        self.original_cassette_load: Optional[Any] = None
+        # when set, cassettes are deleted in the background
+        self.deletion_worker = deletion_worker
+        # how many consecutive failures a cassette needs to be deleted, for markers not saying otherwise
+        self.min_failures = min_failures
+        # the failure counters, loaded from the pytest cache the first time they are needed
+        self.failure_counters: Optional[FailureCounters] = None
+        # when set, the re-record costs of the deleted cassettes are measured
+        self.costs = costs
+
+
+class PhaseOutcomes:
+    """The outcome ("passed", "failed" or "skipped") of every phase of the last attempt of a test run. Only the
+    outcomes are kept: the reports, with their tracebacks and captured output, are left to pytest.
+
+    A test can be run more than once in the same protocol, e.g. by pytest-rerunfailures: every attempt starts over
+    with its setup, and only the last one decides whether the test failed.
+    """
+
+    __slots__ = ("setup", "call", "teardown", "duration")
+
+    def __init__(self) -> None:
+        self.setup: Optional[str] = None
+        self.call: Optional[str] = None
+        self.teardown: Optional[str] = None
+        # the duration of the phases run so far, in seconds
+        self.duration = 0.0
+
+    @property
+    def failed(self) -> bool:
+        """True if any phase has failed."""
+        return "failed" in (self.setup, self.call, self.teardown)
+
+
+session_state_key = pytest.StashKey[SessionState]()
+# the plugin markers found on an item at collection time
+item_markers_key = pytest.StashKey[Tuple[Mark, ...]]()
+# the phases outcomes of an item, kept only while its run protocol is in progress
+phase_outcomes_key = pytest.StashKey[PhaseOutcomes]()
+# the path of the cassette pytest-recording used for an item, captured while its fixtures were available
+recording_cassette_key = pytest.StashKey[str]()
+
+
+def get_session_state(config: Config) -> SessionState:
+    """Return the plugin state of the session the config belongs to."""
+    return config.stash[session_state_key]
+
+
+def get_cassette_index(config: Config) -> CassetteIndex:
+    """Return the cassette index of the session the config belongs to."""
+    return get_session_state(config).cassette_index
 
 
 # noinspection PyUnusedLocal
 @pytest.hookimpl(tryfirst=True, hookwrapper=True)
 def pytest_runtest_makereport(
-    item: FunctionWithReports, call: CallInfo[None]
+    item: Function, call: CallInfo[None]
 ) -> Generator[None, TestReport, None]:
     """Hook used to make available to fixtures tests results."""
     outcome = yield
-    rep = outcome.get_result()
+    if not get_item_markers(item):
+        # nothing to keep track of for tests that will never delete a cassette
+        return
+    timings = get_session_state(item.config).timings
+    if timings is None:
+        record_report(item, call, outcome.get_result())
+    else:
+        run_timed(
+            timings,
+            "pytest_runtest_makereport",
+            item.nodeid,
+            record_report,
+            item,
+            call,
+            outcome.get_result(),
+        )
 
-    # inject the empty reports item if necessary
-    if not hasattr(item, "reports"):
-        setattr(item, "reports", {"setup": None, "call": None, "teardown": None})
 
-    # set a report attribute for each phase of a call: setup, call, teardown
-    # this gets rewritten, but since a failure stop a phase, it's the last report that counts
-    item.reports[rep.when] = rep
+def record_report(item: Function, call: CallInfo[None], rep: TestReport) -> None:
+    """Store the phase outcome into the item and tag the class if a class scoped fixture failed."""
+    outcomes = item.stash.get(phase_outcomes_key, None)
+    if outcomes is None:
+        outcomes = item.stash[phase_outcomes_key] = PhaseOutcomes()
 
-    # If class scoped test setup/teardown fails, tag the class to signal that it happened
-    if item.cls is not None and rep.when != "call":
-        setattr(item.cls, f"cls_{rep.when}_failed", has_class_scoped_phase_failed(rep))
+    if rep.when == "setup" and outcomes.setup is not None:
+        # a new attempt of the same test (a rerun): the previous attempts outcomes don't count anymore
+        outcomes.call = outcomes.teardown = None
+        outcomes.duration = 0.0
 
+    # set the outcome of each phase of a call: setup, call, teardown
+    setattr(outcomes, rep.when, rep.outcome)
+    outcomes.duration += rep.duration
 
-def has_class_scoped_phase_failed(report: TestReport) -> bool:
-    """This will return True if the report describe a failed phase coming from a class scoped fixture."""
-    if len(report.longreprtext) > 0:
-        pattern = re.compile(
-            r"(@pytest\.fixture\()(.*)(scope *= *)([\"\'])(class)([\"\'])(.*)(\))"
-        )
-        found = pattern.search(report.longreprtext)
-        if found:
+    # fixtures values are dropped once the test is over: the cassette used by pytest-recording must be captured now
+    if rep.when == "setup":
+        path = get_recording_cassette_path(item)
+        if path is not None:
+            item.stash[recording_cassette_key] = path
+
+    # If a class, module or session scoped fixture fails in setup/teardown, record it to signal that it happened
+    if rep.when != "call" and call.excinfo is not None:
+        record_scoped_failures(item, call)
+    elif rep.when == "setup" and getattr(item, "execution_count", 1) > 1:
+        # pytest-rerunfailures runs the failed scoped fixtures again on reruns: they just worked
+        clear_scoped_setup_failures(item)
+
+
+def record_scoped_failures(item: Function, call: CallInfo[None]) -> None:
+    """Record in the session registry if a class, module or session scoped fixture failed in this phase.
+
+    A scoped fixture is executed once per scope key: its failure is then cached and raised again for every following
+    test, and it can't start failing after a success. So there's nothing to update on phases that didn't raise, or
+    when the failure is already known.
+    """
+    failures = get_session_state(item.config).scoped_failures
+    for scope in fixture_scopes:
+        key = get_scope_key(item, scope)
+        if key is None:
+            continue
+        if call.when in failures.get((scope, key), ()):
+            continue
+        if has_scoped_phase_failed(item, call, scope):
+            failures.setdefault((scope, key), set()).add(call.when)
+
+
+def clear_scoped_setup_failures(item: Function) -> None:
+    """Forget the setup failures of the scoped fixtures used by the item, whose setup has just passed."""
+    failures = get_session_state(item.config).scoped_failures
+    if not failures:
+        return
+    for scope in fixture_scopes:
+        key = get_scope_key(item, scope)
+        if key is not None:
+            failures.get((scope, key), set()).discard("setup")
+
+
+def get_scope_node(item: Function, scope: str) -> Optional[Node]:
+    """Return the node of the given scope ("class", "module" or "session") the item belongs to, if any."""
+    if scope == "class":
+        return item.getparent(pytest.Class)
+    if scope == "module":
+        return item.getparent(pytest.Module)
+    return item.session
+
+
+def get_scope_key(item: Function, scope: str) -> Optional[str]:
+    """Return the key identifying the fixtures instances of the given scope used by the item, or None if the item
+    does not belong to a node of that scope (like a function outside a class).
+
+    This is the node id of the scope node, so that inherited test classes get their own key, followed by the indices
+    of the parameters of that scope or higher, since every one of their combinations gets its own fixtures instances.
+    """
+    node = get_scope_node(item, scope)
+    if node is None:
+        return None
+    callspec = getattr(item, "callspec", None)
+    if callspec is None:
+        return node.nodeid
+    name2fixturedefs = item._fixtureinfo.name2fixturedefs
+    higher_scopes = scopes_order[scopes_order.index(scope) :]
+    params = [
+        f"{name}={index}"
+        for name, index in sorted(callspec.indices.items())
+        if name in name2fixturedefs
+        and name2fixturedefs[name][-1].scope in higher_scopes
+    ]
+    return f"{node.nodeid}[{'-'.join(params)}]" if params else node.nodeid
+
+
+def get_fixture_codes(fixturedef: "FixtureDef[Any]") -> Set[CodeType]:
+    """Return the code objects of the fixture function, including the ones of every function it wraps."""
+    codes = set()
+    func: Any = fixturedef.func
+    while func is not None:
+        # unbound methods must be unpacked to get to their code
+        func = getattr(func, "__func__", func)
+        code = getattr(func, "__code__", None)
+        if code is not None:
+            codes.add(code)
+        func = getattr(func, "__wrapped__", None)
+    return codes
+
+
+def get_scoped_fixture_codes(
+    item: Function, state: SessionState, scope: str
+) -> Set[CodeType]:
+    """Return the code objects of the fixtures of the given scope used by the item. Fixtures definitions are looked
+    up only once per scope node."""
+    node = get_scope_node(item, scope)
+    key = (scope, node.nodeid if node is not None else item.nodeid)
+    known_names, codes = state.scoped_fixtures.setdefault(key, (set(), set()))
+    for name, fixturedefs in item._fixtureinfo.name2fixturedefs.items():
+        if name not in known_names:
+            known_names.add(name)
+            for fixturedef in fixturedefs:
+                if fixturedef.scope == scope:
+                    codes.update(get_fixture_codes(fixturedef))
+    return codes
+
+
+def has_scoped_phase_failed(
+    item: Function, call: CallInfo[None], scope: str = "class"
+) -> bool:
+    """This will return True if the call describes a phase failed because of a fixture of the given scope.
+
+    Instead of looking at the rendered report, the exception traceback frames are compared with the scoped fixtures
+    functions: if one of them is found, the exception originated (or was cached) from there.
+    """
+    if call.excinfo is None or call.excinfo.errisinstance(pytest.skip.Exception):
+        return False
+    codes = get_scoped_fixture_codes(item, get_session_state(item.config), scope)
+    if not codes:
+        return False
+    tb: Optional[TracebackType] = call.excinfo.tb
+    while tb is not None:
+        if tb.tb_frame.f_code in codes:
             return True
+        tb = tb.tb_next
     return False
 
 
-def has_class_scoped_setup_failed(item: FunctionWithReports) -> bool:
-    """Return True if test has failed because of a class scoped fixture in the setup phase."""
-    if item.cls is not None and item.cls.cls_setup_failed:
-        return True
-    else:
+def has_scoped_fixture_failed(item: Function, scope: str, when: str) -> bool:
+    """Return True if a fixture of the given scope used by the test has failed in the given phase."""
+    state = item.config.stash.get(session_state_key, None)
+    if state is None or not state.scoped_failures:
         return False
+    key = get_scope_key(item, scope)
+    return key is not None and when in state.scoped_failures.get((scope, key), ())
 
 
-def has_class_scoped_teardown_failed(item: FunctionWithReports) -> bool:
+def has_class_scoped_setup_failed(item: Function) -> bool:
+    """Return True if test has failed because of a class scoped fixture in the setup phase."""
+    return has_scoped_fixture_failed(item, "class", "setup")
+
+
+def has_class_scoped_teardown_failed(item: Function) -> bool:
     """Return True if test has failed because of a class scoped fixture in the teardown phase."""
-    if item.cls is not None and item.cls.cls_teardown_failed:
-        return True
-    else:
-        return False
+    return has_scoped_fixture_failed(item, "class", "teardown")
+
+
+def has_module_scoped_setup_failed(item: Function) -> bool:
+    """Return True if test has failed because of a module scoped fixture in the setup phase."""
+    return has_scoped_fixture_failed(item, "module", "setup")
+
+
+def has_module_scoped_teardown_failed(item: Function) -> bool:
+    """Return True if test has failed because of a module scoped fixture in the teardown phase."""
+    return has_scoped_fixture_failed(item, "module", "teardown")
+
+
+def has_session_scoped_setup_failed(item: Function) -> bool:
+    """Return True if test has failed because of a session scoped fixture in the setup phase."""
+    return has_scoped_fixture_failed(item, "session", "setup")
+
+
+def has_session_scoped_teardown_failed(item: Function) -> bool:
+    """Return True if test has failed because of a session scoped fixture in the teardown phase."""
+    return has_scoped_fixture_failed(item, "session", "teardown")
 
 
 def get_cassette_folder_path(test_file_path: str) -> str:
@@ -93,57 +1129,747 @@ def get_cassette_folder_path(test_file_path: str) -> str:
     )
 
 
+def get_recording_cassette_path(item: Function) -> Optional[str]:
+    """Return the path of the cassette pytest-recording is using for the item, if any.
+
+    This is the path vcrpy actually saves the cassette to, so it honours everything contributing to it: the
+    vcr_cassette_dir and default_cassette_name fixtures, the default_cassette marker and the vcr_config / vcr marker
+    settings like cassette_library_dir, path_transformer and serializer. It's only available while the test fixtures
+    are.
+    """
+    funcargs = getattr(item, "funcargs", None)
+    if not funcargs:
+        return None
+    cassette = funcargs.get("vcr")
+    if isinstance(cassette, Cassette):
+        return str(cassette._path)
+    return None
+
+
 def get_default_cassette_path(item: Function) -> str:
-    """Return the cassette full path given the test item."""
+    """Return the cassette full path given the test item.
+
+    If pytest-recording recorded a cassette for the test, that cassette path is returned; otherwise the path follows
+    the pytest-recording default convention.
+    """
+    path = item.stash.get(recording_cassette_key, None) or get_recording_cassette_path(
+        item
+    )
+    if path is not None:
+        return path
     test = item.location[2]
     test_file_path = item.location[0]
     cassette_path = get_cassette_folder_path(test_file_path)
     return f"{cassette_path}/{test}.yaml"
 
 
+def get_default_cassette_dir(item: Function) -> str:
+    """Return the path of the cassette directory of the test item: the default cassette path, without extension."""
+    return os.path.splitext(get_default_cassette_path(item))[0]
+
+
 def delete_cassette(cassette_path: str) -> None:
-    """Delete the provided cassette from disk."""
-    if os.path.exists(cassette_path):
-        os.remove(cassette_path)
+    """Delete the provided cassette (or cassette directory) from disk."""
+    remove_path(cassette_path)
 
 
-def test_failed(item: FunctionWithReports) -> bool:
-    """Check the reports and determine if a test has failed."""
-    if (
-        (item.reports["setup"] and item.reports["setup"].failed)
-        or (item.reports["call"] and item.reports["call"].failed)
-        or (item.reports["teardown"] and item.reports["teardown"].failed)
-    ):
+def remove_path(path: str) -> bool:
+    """Remove the file or, if it's a directory, the whole tree below it. Return False if it did not exist.
+
+    Files are removed straight away, without checking first what they are: only when that fails because the path is a
+    directory it's removed with shutil.rmtree, which walks the tree through file descriptors where supported.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    except (IsADirectoryError, PermissionError):
+        # removing a directory raises PermissionError on some platforms, like macOS
+        if not os.path.isdir(path):
+            raise
+        try:
+            shutil.rmtree(path)
+        except FileNotFoundError:
+            return False
+    return True
+
+
+def remove_cassette(
+    state: SessionState, cassette_path: str, owners: Iterable[str] = ()
+) -> None:
+    """Delete the provided cassette from disk (or move it into the quarantine folder) and from the index. The file is
+    removed straight away, without checking first if it exists. If it was there, it's recorded as deleted on behalf of
+    the owners tests. With background deletion, the file is removed by a worker thread instead.
+    """
+    if state.deletion_worker is not None:
+        # the index is only updated from the main thread: the cassette is as good as gone already
+        state.cassette_index.discard(cassette_path)
+        state.deletion_worker.submit(
+            cassette_path, remove_cassette_file_and_record, state, cassette_path, owners
+        )
+        return
+    remove_cassette_file_and_record(state, cassette_path, owners)
+    state.cassette_index.discard(cassette_path)
+
+
+def remove_cassette_file_and_record(
+    state: SessionState, cassette_path: str, owners: Iterable[str]
+) -> None:
+    """Remove the cassette file and, if it was there, record it as deleted on behalf of the owners tests. This is
+    what the background deletion workers run. If the re-record costs are measured, the cassette is measured first.
+    """
+    measures = measure_cassette(cassette_path) if state.costs is not None else None
+    removed = run_timed(
+        state.timings,
+        deletion_category,
+        None,
+        remove_cassette_file,
+        state,
+        cassette_path,
+    )
+    if removed:
+        if state.deletion_worker is not None:
+            with state.deletion_worker.lock:
+                record_deleted_cassette(state, cassette_path, owners, measures)
+        else:
+            record_deleted_cassette(state, cassette_path, owners, measures)
+
+
+def record_deleted_cassette(
+    state: SessionState,
+    cassette_path: str,
+    owners: Iterable[str],
+    measures: Optional[Tuple[int, Optional[int]]] = None,
+) -> None:
+    """Record the cassette as deleted on behalf of the owners tests, together with its size and interactions."""
+    path = os.path.abspath(cassette_path)
+    state.deleted_cassettes.setdefault(path, set()).update(owners)
+    if state.costs is not None and measures is not None:
+        state.costs.add_deleted(path, *measures)
+
+
+def remove_cassette_file(state: SessionState, cassette_path: str) -> bool:
+    """Delete the cassette file (or directory), or move it into the quarantine folder. Return False if it did not
+    exist."""
+    if state.quarantine is None:
+        return remove_path(cassette_path)
+    try:
+        state.quarantine.move(cassette_path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def delete_cassettes_in_bulk(
+    state: SessionState, cassettes: Dict[str, Set[str]]
+) -> None:
+    """Delete the provided cassettes (with the node ids of their tests) grouping them by folder: every folder gets
+    listed only once and only the cassettes actually found there are removed, instead of checking every single path.
+    With the cassette index, folders that did not change since they were indexed are not even listed again.
+    """
+    folders: Dict[str, Set[str]] = {}
+    for cassette in cassettes:
+        folder, name = os.path.split(cassette)
+        folders.setdefault(folder, set()).add(name)
+
+    for folder, names in folders.items():
+        if state.use_index:
+            # a single os.stat of the folder, unless it changed since it was listed
+            index = state.cassette_index
+            index.listdir(folder, revalidate=True)
+            found = [
+                os.path.join(folder, name)
+                for name in names
+                if index.exists(os.path.join(folder, name))
+            ]
+        else:
+            try:
+                with os.scandir(folder or os.curdir) as entries:
+                    found = [entry.path for entry in entries if entry.name in names]
+            except (FileNotFoundError, NotADirectoryError):
+                # the whole folder is gone, nothing to delete in there
+                continue
+        for cassette in found:
+            remove_cassette(state, cassette, cassettes.get(cassette, ()))
+
+
+def schedule_cassettes_deletion(
+    state: SessionState, cassettes: Iterable[str], owner: str
+) -> None:
+    """Delete the provided cassettes of the owner test right away or, in deferred mode (or on a pytest-xdist worker),
+    remember them for the end of the session. With the cassette index, cassettes it does not know are not deleted.
+    """
+    if state.deferred or state.xdist_worker:
+        for cassette in cassettes:
+            # paths are made absolute here, since the working directory could change before the session ends
+            state.pending_deletions.setdefault(os.path.abspath(cassette), set()).add(
+                owner
+            )
+    else:
+        for cassette in cassettes:
+            if state.use_index and not state.cassette_index.exists(
+                cassette, revalidate=True
+            ):
+                # not on disk: the folder did not change since it was listed without it
+                continue
+            remove_cassette(state, cassette, (owner,))
+
+
+def track_loaded_cassettes(state: SessionState) -> None:
+    """Replace vcrpy Cassette.load, so that the cassettes loaded while a test is running are recorded together with
+    the number of interactions they had on disk. This is done once, the first time it's needed.
+    """
+    if state.original_cassette_load is not None:
+        return
+    original_load = Cassette.__dict__["load"]
+    state.original_cassette_load = original_load
+
+    def load(cls: Type[Cassette], /, **kwargs: Any) -> Cassette:
+        cassette = original_load.__func__(cls, **kwargs)
+        loaded = state.loaded_cassettes
+        if loaded is not None:
+            path = os.path.abspath(cassette._path)
+            # only the first load tells how many interactions the cassette had when the test started
+            initial_count = loaded[path][0] if path in loaded else len(cassette.data)
+            loaded[path] = (initial_count, cassette)
+        return cassette
+
+    setattr(Cassette, "load", classmethod(load))
+
+
+def restore_cassette_load(state: SessionState) -> None:
+    """Put back the original vcrpy Cassette.load, if it has been replaced."""
+    if state.original_cassette_load is not None:
+        setattr(Cassette, "load", state.original_cassette_load)
+        state.original_cassette_load = None
+
+
+def prune_cassette(state: SessionState, cassette_path: str) -> bool:
+    """Rewrite a cassette loaded by the test without the interactions the test appended to it. Return False if the
+    cassette was not loaded by the test, or if the test recorded it from scratch: it's up to the caller to delete it,
+    like any other cassette."""
+    loaded = state.loaded_cassettes or {}
+    path = os.path.abspath(cassette_path)
+    if path not in loaded:
+        return False
+    initial_count, cassette = loaded[path]
+    if initial_count == 0:
+        return False
+    if len(cassette.data) <= initial_count:
         return True
-    return False
+    elif (
+        cassette._persister is FilesystemPersister
+        and cassette._serializer is yamlserializer
+    ):
+        # the common case: no need to serialize the whole cassette again
+        prune_yaml_cassette_file(cassette._path, initial_count)
+        state.cassette_index.refresh(path)
+    else:
+        kept = cassette.data[:initial_count]
+        cassette._persister.save_cassette(
+            cassette._path,
+            {
+                "requests": [request for request, _ in kept],
+                "responses": [response for _, response in kept],
+            },
+            serializer=cassette._serializer,
+        )
+        state.cassette_index.refresh(path)
+    return True
+
+
+# the lines starting at the first column of a yaml cassette: the top level keys and the interactions list items
+yaml_top_level_line = re.compile(rb"^[^ \t\r\n]", re.MULTILINE)
+
+
+def prune_yaml_cassette_file(
+    cassette_path: str, keep: int, chunk_size: int = 1024 * 1024
+) -> None:
+    """Rewrite a yaml cassette keeping only its first `keep` interactions, without parsing it.
+
+    The file is copied chunk by chunk (so memory stays bounded, whatever the size of the cassette or of its lines) to a
+    temporary file, which then atomically replaces the cassette. This relies on the layout used by vcrpy: the only lines
+    starting at the first column are the top level keys and the items of the interactions list.
+    """
+    folder = os.path.dirname(os.path.abspath(cassette_path))
+    fd, temp_path = tempfile.mkstemp(dir=folder, prefix=".vcr_dof_", suffix=".tmp")
+    try:
+        with open(cassette_path, "rb") as source, os.fdopen(fd, "wb") as destination:
+            interactions = 0
+            copying = True
+            at_line_start = True
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                position = 0
+                for match in yaml_top_level_line.finditer(chunk):
+                    start = match.start()
+                    if start == 0 and not at_line_start:
+                        # the chunk starts in the middle of a line
+                        continue
+                    if copying:
+                        destination.write(chunk[position:start])
+                    position = start
+                    if chunk[start : start + 1] == b"-":
+                        interactions += 1
+                        copying = interactions <= keep
+                    else:
+                        # a top level key, like the cassette version
+                        copying = True
+                if copying:
+                    destination.write(chunk[position:])
+                at_line_start = chunk.endswith(b"\n")
+        shutil.copymode(cassette_path, temp_path)
+        os.replace(temp_path, cassette_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def count_yaml_cassette_interactions(
+    cassette_path: str, chunk_size: int = 1024 * 1024
+) -> int:
+    """Count the interactions of a yaml cassette chunk by chunk, without parsing it (see prune_yaml_cassette_file)."""
+    interactions = 0
+    at_line_start = True
+    with open(cassette_path, "rb") as source:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return interactions
+            for match in yaml_top_level_line.finditer(chunk):
+                if match.start() == 0 and not at_line_start:
+                    # the chunk starts in the middle of a line
+                    continue
+                if chunk[match.start() : match.start() + 1] == b"-":
+                    interactions += 1
+            at_line_start = chunk.endswith(b"\n")
+
+
+def count_cassette_interactions(cassette_path: str) -> Optional[int]:
+    """Return the number of interactions of a cassette saved by the vcrpy yaml or json serializers, or None if it
+    can't be told."""
+    extension = os.path.splitext(cassette_path)[1].lower()
+    try:
+        if extension in (".yaml", ".yml"):
+            return count_yaml_cassette_interactions(cassette_path)
+        if extension == ".json":
+            with open(cassette_path) as f:
+                return len(json.load(f)["interactions"])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def measure_cassette(cassette_path: str) -> Optional[Tuple[int, Optional[int]]]:
+    """Return the size (in bytes) and the number of interactions of a cassette, or of every cassette inside a
+    directory. Return None if there's nothing there."""
+    if not os.path.isdir(cassette_path):
+        try:
+            size = os.stat(cassette_path).st_size
+        except OSError:
+            return None
+        return size, count_cassette_interactions(cassette_path)
+    total_size = 0
+    counts: List[int] = []
+    for folder, _, names in os.walk(cassette_path):
+        for name in names:
+            measures = measure_cassette(os.path.join(folder, name))
+            if measures is not None:
+                total_size += measures[0]
+                if measures[1] is not None:
+                    counts.append(measures[1])
+    return total_size, sum(counts) if counts else None
+
+
+def test_failed(item: Function) -> bool:
+    """Check the phases outcomes and determine if a test has failed."""
+    outcomes = item.stash.get(phase_outcomes_key, None)
+    return outcomes is not None and outcomes.failed
+
+
+def test_passed(item: Function) -> bool:
+    """Check the phases outcomes and determine if a test has run and passed."""
+    outcomes = item.stash.get(phase_outcomes_key, None)
+    return outcomes is not None and outcomes.call == "passed" and not outcomes.failed
 
 
 # noinspection PyUnusedLocal
 @pytest.hookimpl(hookwrapper=True)
 def pytest_runtest_protocol(
-    item: FunctionWithReports, nextitem: Optional[Function]
+    item: Function, nextitem: Optional[Function]
 ) -> Generator[None, None, None]:
-    yield
-    markers = list(item.iter_markers(marker_name))
+    markers = get_item_markers(item)
+    if not markers:
+        yield
+        return
+    state = get_session_state(item.config)
+    tracking = any(
+        get_parsed_mark(state, mark).needs_loaded_cassettes(state.prune)
+        for mark in markers
+    )
+    if tracking:
+        track_loaded_cassettes(state)
+        state.loaded_cassettes = {}
+    try:
+        yield
+        if state.timings is None:
+            delete_failed_test_cassettes(state, item, markers)
+        else:
+            run_timed(
+                state.timings,
+                "pytest_runtest_protocol",
+                item.nodeid,
+                delete_failed_test_cassettes,
+                state,
+                item,
+                markers,
+            )
+    finally:
+        if tracking:
+            state.loaded_cassettes = None
+        # the outcomes are not needed anymore: don't keep them for the rest of the session
+        if phase_outcomes_key in item.stash:
+            del item.stash[phase_outcomes_key]
+
+
+def delete_failed_test_cassettes(
+    state: SessionState, item: Function, markers: Tuple[Mark, ...]
+) -> None:
+    """Delete (or schedule the deletion of) the cassettes targeted by the item markers, if the test has failed."""
     cassettes: Set[str] = set()
-    skip = False
 
-    if len(markers) > 0 and test_failed(item):
+    if test_failed(item):
         # at least a marker was used and the test has failed
+        parsed_marks = [get_parsed_mark(state, mark) for mark in markers]
+
+        if any(parsed.skip for parsed in parsed_marks):
+            # This test has been marked as skip: no cassette will be deleted
+            return
+
+        to_prune: Set[str] = set()
+        for mark, parsed in zip(markers, parsed_marks):
+            if is_scope_already_handled(state, mark, parsed, item):
+                # a previous test of the same scope already took care of these cassettes
+                continue
+            targets = get_cassettes(parsed, item)
+            min_failures = parsed.get_min_failures(state.min_failures)
+            if min_failures > 1:
+                targets = count_cassettes_failures(state, item, targets, min_failures)
+            if parsed.should_prune(state.prune):
+                to_prune.update(targets)
+            else:
+                cassettes.update(targets)
+
+        # a cassette another marker wants deleted is not worth pruning
+        for cassette in to_prune - cassettes:
+            if not prune_cassette(state, cassette):
+                cassettes.add(cassette)
+
+        schedule_cassettes_deletion(state, cassettes, item.nodeid)
+
+    elif test_passed(item):
+        counters = get_failure_counters(item.config, state)
+        if counters is not None:
+            counters.count_pass(item.nodeid)
+        if state.costs is not None:
+            state.costs.add_test_duration(
+                item.nodeid, item.stash[phase_outcomes_key].duration
+            )
+
+
+def count_cassettes_failures(
+    state: SessionState, item: Function, cassettes: Set[str], min_failures: int
+) -> Set[str]:
+    """Count a failure of the test cassettes, and return the ones that reached min_failures consecutive failures.
+    Without the pytest cache failures can't be counted: every cassette is returned."""
+    counters = get_failure_counters(item.config, state)
+    if counters is None:
+        return cassettes
+    return {
+        cassette
+        for cassette in cassettes
+        if counters.count_failure(os.path.abspath(cassette), item.nodeid, min_failures)
+    }
+
+
+# noinspection PyUnusedLocal
+@pytest.hookimpl(trylast=True)
+def pytest_collection_modifyitems(
+    session: Session, config: Config, items: List[pytest.Item]
+) -> None:
+    """Look for the plugin markers once per item, so that the per-test hooks can skip unmarked items right away.
+
+    Markers inherited from modules and classes are looked up only once per parent node.
+    """
+    state = get_session_state(config)
+    run_timed(
+        state.timings,
+        "pytest_collection_modifyitems",
+        None,
+        collect_item_markers,
+        state,
+        items,
+    )
+    if config.getoption(rerun_deleted_option):
+        deselect_tests_with_cassettes(config, items)
+
+
+def deselect_tests_with_cassettes(config: Config, items: List[pytest.Item]) -> None:
+    """Keep only the tests whose cassettes have been deleted (and not recorded again yet)."""
+    to_rerun = get_tests_to_rerun(config)
+    selected = [item for item in items if item.nodeid in to_rerun]
+    if len(selected) < len(items):
+        config.hook.pytest_deselected(
+            items=[item for item in items if item.nodeid not in to_rerun]
+        )
+        items[:] = selected
+
+
+def collect_item_markers(state: SessionState, items: List[pytest.Item]) -> None:
+    """Store the plugin markers of every item into its stash and, if needed, index the cassettes folders.
+
+    Markers are parsed here as well: an invalid marker argument stops the session before any test is run.
+    """
+    inherited_markers: Dict[int, Tuple[Mark, ...]] = {}
+    for item in items:
+        parent = item.parent
+        inherited = inherited_markers.get(id(parent))
+        if inherited is None:
+            inherited = tuple(parent.iter_markers(marker_name)) if parent else ()
+            inherited_markers[id(parent)] = inherited
+        own = tuple(mark for mark in item.own_markers if mark.name == marker_name)
+        # same order used by iter_markers: the closest markers first
+        markers = own + inherited if own else inherited
+        item.stash[item_markers_key] = markers
         for mark in markers:
+            try:
+                get_parsed_mark(state, mark)
+            except ValueError as e:
+                raise pytest.UsageError(f"{item.nodeid}: {e}") from e
+
+    if state.use_index:
+        # index the cassettes folders next to the collected test files
+        folders = {
+            os.path.join(os.path.dirname(item.path), "cassettes") for item in items
+        }
+        for folder in folders:
+            state.cassette_index.scan(folder)
+
+
+def get_item_markers(item: pytest.Item) -> Tuple[Mark, ...]:
+    """Return the plugin markers of the item, as found at collection time."""
+    markers = item.stash.get(item_markers_key, None)
+    if markers is None:
+        # the item did not go through the collection hook
+        markers = tuple(item.iter_markers(marker_name))
+        item.stash[item_markers_key] = markers
+    return markers
+
+
+# noinspection PyUnusedLocal
+def pytest_sessionfinish(
+    session: Session, exitstatus: Union[int, pytest.ExitCode]
+) -> None:
+    """Delete every cassette whose deletion has been deferred to the end of the session. On pytest-xdist workers, send
+    them to the controller instead."""
+    state = get_session_state(session.config)
+    if state.xdist_worker:
+        workeroutput = getattr(session.config, "workeroutput")
+        workeroutput[xdist_workeroutput_key] = {
+            cassette: sorted(owners)
+            for cassette, owners in state.pending_deletions.items()
+        }
+        state.pending_deletions.clear()
+        if state.timings is not None:
+            workeroutput[xdist_timings_key] = state.timings.as_dict()
+        if state.failure_counters is not None:
+            workeroutput[xdist_failures_key] = state.failure_counters.as_dict()
+        if state.costs is not None:
+            workeroutput[xdist_costs_key] = state.costs.durations
+    elif state.pending_deletions:
+        run_timed(
+            state.timings,
+            "pytest_sessionfinish",
+            None,
+            delete_cassettes_in_bulk,
+            state,
+            state.pending_deletions,
+        )
+        state.pending_deletions.clear()
+
+    if state.deletion_worker is not None:
+        # every deletion must be done before the session is over
+        run_timed(
+            state.timings,
+            "pytest_sessionfinish",
+            None,
+            state.deletion_worker.join,
+        )
+
+    if not state.xdist_worker:
+        update_deletion_manifest(session.config, state)
+        update_failure_counters(session.config, state)
+        update_recording_costs(session.config, state)
+
+    json_path = session.config.getoption(timings_json_option) or session.config.getini(
+        timings_json_option
+    )
+    if state.timings is not None and json_path and not state.xdist_worker:
+        write_timings_json(
+            state.timings, os.path.join(str(session.config.rootpath), json_path)
+        )
+
+
+# noinspection PyUnusedLocal
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node: Any, error: Optional[object]) -> None:
+    """pytest-xdist controller only: collect the cassettes a worker wants deleted. They will be deleted once, when
+    every worker has finished, so that no worker can be still replaying them. The worker failure counters changes, and
+    the durations of the tests that recorded cassettes again, are collected as well."""
+    workeroutput = getattr(node, "workeroutput", None) or {}
+    state = get_session_state(node.config)
+    for cassette, owners in workeroutput.get(xdist_workeroutput_key, {}).items():
+        state.pending_deletions.setdefault(cassette, set()).update(owners)
+    if state.timings is not None and xdist_timings_key in workeroutput:
+        state.timings.merge(workeroutput[xdist_timings_key])
+    if xdist_failures_key in workeroutput:
+        counters = get_failure_counters(node.config, state)
+        if counters is not None:
+            counters.merge(workeroutput[xdist_failures_key])
+    if state.costs is not None:
+        state.costs.durations.update(workeroutput.get(xdist_costs_key, {}))
+
+
+def update_deletion_manifest(config: Config, state: SessionState) -> None:
+    """Store in the pytest cache the cassettes deleted so far, with the node ids of their tests. Cassettes deleted by
+    a previous session are kept until they are recorded again."""
+    cache = getattr(config, "cache", None)
+    if cache is None:
+        # the cacheprovider plugin has been disabled
+        return
+    previous: Dict[str, List[str]] = cache.get(manifest_cache_key, {})
+    if not previous and not state.deleted_cassettes:
+        return
+    manifest = {
+        cassette: set(owners)
+        for cassette, owners in previous.items()
+        if not os.path.exists(cassette)
+    }
+    for cassette, owners in state.deleted_cassettes.items():
+        manifest.setdefault(cassette, set()).update(owners)
+    cache.set(
+        manifest_cache_key,
+        {cassette: sorted(owners) for cassette, owners in manifest.items()},
+    )
+
 
-            arguments = parse_marker_arguments(mark)
+def get_failure_counters(
+    config: Config, state: SessionState
+) -> Optional[FailureCounters]:
+    """Return the failure counters of the session, loading them from the pytest cache the first time. Return None if
+    the cacheprovider plugin has been disabled."""
+    if state.failure_counters is None:
+        cache = getattr(config, "cache", None)
+        if cache is None:
+            return None
+        state.failure_counters = FailureCounters(cache.get(failures_cache_key, {}))
+    return state.failure_counters
 
-            if should_skip_the_test(arguments):
-                # This test has been marked as skip: no cassette will be deleted
-                skip = True
 
-            mark_cassettes = get_cassettes(arguments, item)
-            cassettes = cassettes.union(mark_cassettes)
+def update_failure_counters(config: Config, state: SessionState) -> None:
+    """Store in the pytest cache the failure counters, if they changed in this session."""
+    counters = state.failure_counters
+    cache = getattr(config, "cache", None)
+    if counters is None or cache is None or not counters.changed:
+        return
+    cache.set(failures_cache_key, counters.stored())
 
-        if not skip:
-            for cassette in cassettes:
-                delete_cassette(cassette)
+
+def update_recording_costs(config: Config, state: SessionState) -> None:
+    """Store in the pytest cache the re-record costs, if they changed in this session."""
+    costs = state.costs
+    cache = getattr(config, "cache", None)
+    if costs is None or cache is None or not costs.changed:
+        return
+    costs.update_recordings()
+    cache.set(costs_cache_key, costs.as_stored())
+
+
+def get_tests_to_rerun(config: Config) -> Set[str]:
+    """Return the node ids of the tests whose cassettes, according to the manifest, are still missing."""
+    cache = getattr(config, "cache", None)
+    manifest: Dict[str, List[str]] = (
+        cache.get(manifest_cache_key, {}) if cache is not None else {}
+    )
+    return {
+        owner
+        for cassette, owners in manifest.items()
+        if not os.path.exists(cassette)
+        for owner in owners
+    }
+
+
+def write_timings_json(timings: Timings, path: str) -> None:
+    """Dump the timings summary and the time spent on every test into a json file."""
+    with open(path, "w") as f:
+        json.dump(
+            {"categories": timings.summary(), "items": timings.items}, f, indent=2
+        )
+
+
+# noinspection PyUnusedLocal
+def pytest_terminal_summary(
+    terminalreporter: Any, exitstatus: Union[int, pytest.ExitCode], config: Config
+) -> None:
+    """Report the background deletions errors, if any, the re-record budget and the time spent by the plugin, if
+    measured."""
+    state = get_session_state(config)
+    if state.deletion_worker is not None and state.deletion_worker.errors:
+        terminalreporter.section("vcr delete on fail deletion errors", red=True)
+        for cassette, reason in state.deletion_worker.errors:
+            terminalreporter.write_line(f"{cassette}: {reason}")
+    if state.costs is not None and state.costs.deleted:
+        write_budget(terminalreporter, state.costs, str(config.rootpath))
+    timings = state.timings
+    if timings is None:
+        return
+    terminalreporter.section("vcr delete on fail timings")
+    for category, stats in timings.summary().items():
+        terminalreporter.write_line(
+            f"{category}: {int(stats['count'])} calls, total {stats['total'] * 1000:.2f}ms,"
+            f" p50 {stats['p50'] * 1e6:.1f}us, p99 {stats['p99'] * 1e6:.1f}us,"
+            f" max {stats['max'] * 1e6:.1f}us"
+        )
+    slowest = timings.slowest_items(5)
+    if slowest:
+        terminalreporter.write_line("slowest tests:")
+        for nodeid, duration in slowest:
+            terminalreporter.write_line(f"  {duration * 1e6:.1f}us {nodeid}")
+
+
+def write_budget(terminalreporter: Any, costs: RecordingCosts, rootdir: str) -> None:
+    """Write the re-record budget of the cassettes deleted in this session into the terminal summary."""
+    budget = costs.budget()
+    terminalreporter.section("vcr delete on fail re-record budget")
+    unknown = (
+        f" ({budget['unknown']} without a known recording time)"
+        if budget["unknown"]
+        else ""
+    )
+    terminalreporter.write_line(
+        f"{budget['cassettes']} cassettes deleted: {budget['size'] / 1024:.1f}KB, {budget['interactions']}"
+        f" interactions, {budget['recording']:.2f}s to record them again{unknown}"
+    )
+    terminalreporter.write_line("costliest cassettes:")
+    for cassette, cost in budget["costliest"]:
+        recording = "?" if cost["recording"] is None else f"{cost['recording']:.2f}s"
+        interactions = "?" if cost["interactions"] is None else cost["interactions"]
+        terminalreporter.write_line(
+            f"  {recording} {interactions} interactions {cost['size'] / 1024:.1f}KB"
+            f" {os.path.relpath(cassette, rootdir)}"
+        )
 
 
 def parse_marker_arguments(mark: Mark) -> Dict[str, Any]:
@@ -176,8 +1902,8 @@ def should_delete_default_cassette(args: Dict[str, Any]) -> bool:
 # It's a recursive definition: it can be None, a string, a list of ValidTarget or a function that
 # returns ValidTarget.
 #
-# Essentially, there can be infinitely nested lists/functions: the generator below will extract all string found in the
-# nested structure. Everything else will be silently discarded.
+# Essentially, there can be infinitely nested lists/functions: all strings found in the nested structure will be
+# extracted. Everything else will be silently discarded.
 # None remains a valid value because functions may decide at runtime to not delete a cassette.
 #
 ValidTarget = TypeVar(
@@ -189,10 +1915,13 @@ ValidTarget = TypeVar(
 )
 
 
-def string_from_target_generator(
-    element: Union[Any, ValidTarget], item: Function
-) -> Generator[str, None, None]:
-    """Recurse through the `element` nested structure and extract all string, ignoring everything else.
+def split_target(
+    element: Union[Any, ValidTarget],
+    strings: Set[str],
+    callables: List[Callable[[Function], Any]],
+) -> None:
+    """Walk the `element` nested lists, adding strings and callables to the provided collections. Everything else is
+    discarded.
 
     `element` is passed in from the user, so it's Any. The accepted type though (the one that will actually produce
     strings) is defined as:
@@ -206,58 +1935,582 @@ def string_from_target_generator(
     )
     """
     if isinstance(element, str):
-        # only strings actually get yielded from this generator
-        yield element
+        strings.add(element)
     elif isinstance(element, list):
         for sub_element in element:
-            # for every element of the list, recursively yield from
-            yield from string_from_target_generator(sub_element, item)
+            split_target(sub_element, strings, callables)
     elif callable(element):
-        try:
-            # with the result from the call of the function, recursively yield from
-            yield from string_from_target_generator(element(item), item)
-        except (Exception,):
-            pass
+        callables.append(element)
     # if something reaches this point is not a ValidTarget, so it's discarded
 
 
+def evaluate_targets(
+    evaluator: TargetEvaluator,
+    targets: List[Callable[[Function], Any]],
+    item: Function,
+) -> Set[str]:
+    """Call the target callables (and the ones they return, level by level) and return all the strings found in their
+    results. Callables that fail or time out are reported with a TargetCallableWarning.
+    """
+    cassettes: Set[str] = set()
+    pending = targets
+    while pending:
+        callables: List[Callable[[Function], Any]] = []
+        for target, result, error in evaluator.evaluate(pending, item):
+            if error is None:
+                split_target(result, cassettes, callables)
+            else:
+                name = getattr(target, "__qualname__", repr(target))
+                item.warn(
+                    TargetCallableWarning(
+                        f"{marker_name} target {name} {error}: its cassettes will not be deleted"
+                    )
+                )
+        pending = callables
+    return cassettes
+
+
 def parse_target(
     target: Union[Any, ValidTarget],
     item: Function,
 ) -> Set[str]:
     """Parse the target and return a set of cassette paths."""
-    return set(string_from_target_generator(target, item))
+    cassettes: Set[str] = set()
+    callables: List[Callable[[Function], Any]] = []
+    split_target(target, cassettes, callables)
+    evaluator = get_session_state(item.config).target_evaluator
+    return cassettes | evaluate_targets(evaluator, callables, item)
+
+
+class TargetPattern(ABC):
+    """Base class of the targets matching every cassette with a matching name in a folder. Patterns are callables
+    targets: the folder is listed through the session cassette index, so that many patterns on the same folder cost a
+    single directory listing (plus an os.stat for each evaluation, to notice new files).
+    """
+
+    def __init__(self, folder: str) -> None:
+        self.folder = folder or os.curdir
+
+    @abstractmethod
+    def matches(self, name: str) -> bool:
+        """Return True if the cassette file name matches the pattern."""
+
+    def __call__(self, item: Function) -> List[str]:
+        index = get_cassette_index(item.config)
+        return [
+            entry.path
+            for entry in index.listdir(self.folder, revalidate=True)
+            if self.matches(os.path.basename(entry.path))
+        ]
+
 
+class Glob(TargetPattern):
+    """A target matching cassettes with a shell-style pattern, like ``cassettes/test_mod/test_x*.yaml*``. Only the file
+    name can contain wildcards."""
 
-def get_cassettes(args: Dict[str, Any], item: Function) -> Set[str]:
-    """Return a set of cassette paths derived from the provided marker args."""
-    cassettes = set()
+    def __init__(self, pattern: str) -> None:
+        folder, self.name_pattern = os.path.split(pattern)
+        if any(char in folder for char in "*?["):
+            raise ValueError(
+                f"Only the file name of a Glob target can contain wildcards: {pattern}"
+            )
+        super().__init__(folder)
+        self.pattern = pattern
 
-    if should_delete_default_cassette(args):
+    def matches(self, name: str) -> bool:
+        return fnmatch.fnmatchcase(name, self.name_pattern)
+
+    def __repr__(self) -> str:
+        return f"Glob({self.pattern!r})"
+
+
+class Regex(TargetPattern):
+    """A target matching the cassettes in the folder whose whole file name matches the regular expression."""
+
+    def __init__(self, folder: str, pattern: str) -> None:
+        super().__init__(folder)
+        self.pattern = re.compile(pattern)
+
+    def matches(self, name: str) -> bool:
+        return self.pattern.fullmatch(name) is not None
+
+    def __repr__(self) -> str:
+        return f"Regex({self.folder!r}, {self.pattern.pattern!r})"
+
+
+class ParsedMark:
+    """A marker with its arguments already parsed. Everything that does not depend on the test item (like string
+    targets) is resolved here once, so that markers shared by many tests are not parsed over and over.
+    """
+
+    def __init__(self, mark: Mark) -> None:
+        self.arguments = parse_marker_arguments(mark)
+        self.skip = should_skip_the_test(self.arguments)
+        self.delete_default = should_delete_default_cassette(self.arguments)
+        self.delete_default_dir = bool(self.arguments.get(delete_default_dir_str))
+        # None means: use the session default
+        self.prune: Optional[bool] = self.arguments.get(prune_str)
+        # None means: use the session default
+        self.min_failures: Optional[int] = self.arguments.get(min_failures_str)
+        if self.min_failures is not None and (
+            not isinstance(self.min_failures, int)
+            or isinstance(self.min_failures, bool)
+            or self.min_failures < 1
+        ):
+            raise ValueError(
+                f"{marker_name} {min_failures_str} must be a positive integer"
+            )
+        # when not "function", the cassettes are shared by every test of the scope and deleted only once
+        self.scope: str = self.arguments.get(scope_str, "function")
+        if self.scope != "function" and self.scope not in fixture_scopes:
+            raise ValueError(
+                f"{marker_name} {scope_str} must be one of: function, {', '.join(fixture_scopes)}"
+            )
+        self.static_cassettes: Set[str] = set()
+        # the callables found in the target: these need the item to be evaluated
+        self.dynamic_targets: List[Callable[[Function], Any]] = []
+        if target_str in self.arguments:
+            split_target(
+                self.arguments[target_str], self.static_cassettes, self.dynamic_targets
+            )
+        # the cassettes opened by the test are only known once it has run
+        self.auto = auto_target in self.static_cassettes
+        self.static_cassettes.discard(auto_target)
+
+    def should_prune(self, default: bool) -> bool:
+        """Return True if the cassettes should be pruned instead of deleted, given the session default."""
+        return default if self.prune is None else bool(self.prune)
+
+    def get_min_failures(self, default: int) -> int:
+        """Return how many consecutive failures the cassettes need to be deleted, given the session default."""
+        return default if self.min_failures is None else self.min_failures
+
+    def needs_loaded_cassettes(self, default_prune: bool) -> bool:
+        """Return True if the cassettes loaded by the test must be tracked, given the session pruning default."""
+        return self.auto or self.should_prune(default_prune)
+
+
+def get_parsed_mark(state: SessionState, mark: Mark) -> ParsedMark:
+    """Return the parsed version of the mark, parsing it only the first time it's met in the session."""
+    cached = state.parsed_marks.get(id(mark))
+    if cached is None:
+        cached = (mark, ParsedMark(mark))
+        state.parsed_marks[id(mark)] = cached
+    return cached[1]
+
+
+def is_scope_already_handled(
+    state: SessionState, mark: Mark, parsed: ParsedMark, item: Function
+) -> bool:
+    """Return True if the scoped mark already deleted its cassettes for the scope node of the item; otherwise,
+    record that it's going to do so now."""
+    if parsed.scope == "function":
+        return False
+    scope_key = get_scope_key(item, parsed.scope)
+    if scope_key is None:
+        # outside a class, the class scope falls back to the test itself
+        scope_key = item.nodeid
+    # the session node id is an empty string: the key must be compared with None
+    key = (scope_key, id(mark))
+    if key in state.scoped_deletions:
+        return True
+    state.scoped_deletions.add(key)
+    return False
+
+
+def get_cassettes(parsed: ParsedMark, item: Function) -> Set[str]:
+    """Return a set of cassette paths derived from the provided parsed marker."""
+    cassettes = set(parsed.static_cassettes)
+
+    if parsed.delete_default:
         cassettes.add(get_default_cassette_path(item))
 
-    if target_str in args:
-        target = args[target_str]
-        cassettes = cassettes.union(parse_target(target, item))
+    if parsed.delete_default_dir:
+        cassettes.add(get_default_cassette_dir(item))
+
+    state = get_session_state(item.config)
+    if parsed.auto and state.loaded_cassettes:
+        cassettes.update(state.loaded_cassettes)
+
+    if parsed.dynamic_targets:
+        cassettes.update(
+            run_timed(
+                state.timings,
+                target_callables_category,
+                None,
+                evaluate_targets,
+                state.target_evaluator,
+                parsed.dynamic_targets,
+                item,
+            )
+        )
 
     return cassettes
 
 
+def pytest_addoption(parser: Parser) -> None:
+    group = parser.getgroup("vcr_delete_on_fail")
+    group.addoption(
+        "--vcr-dof-deferred",
+        action="store_true",
+        default=False,
+        dest=deferred_option,
+        help="Do not delete cassettes right after a failing test: collect them and delete them all at once at the end"
+        " of the session.",
+    )
+    parser.addini(
+        deferred_option,
+        type="bool",
+        default=False,
+        help="Defer cassettes deletion to the end of the session (same as --vcr-dof-deferred).",
+    )
+    group.addoption(
+        "--vcr-dof-index",
+        action="store_true",
+        default=False,
+        dest=index_option,
+        help="Index the cassettes folders at the start of the session and use the index when deleting cassettes.",
+    )
+    parser.addini(
+        index_option,
+        type="bool",
+        default=False,
+        help="Index the cassettes folders at the start of the session (same as --vcr-dof-index).",
+    )
+
+    group.addoption(
+        "--vcr-dof-quarantine",
+        action="store_true",
+        default=False,
+        dest=quarantine_option,
+        help="Move the cassettes to delete into a per-session quarantine folder instead of deleting them.",
+    )
+    parser.addini(
+        quarantine_option,
+        type="bool",
+        default=False,
+        help="Move the cassettes to delete into a quarantine folder (same as --vcr-dof-quarantine).",
+    )
+    group.addoption(
+        "--vcr-dof-quarantine-dir",
+        action="store",
+        default=None,
+        dest=quarantine_dir_option,
+        help="The quarantine folder, relative to the rootdir. Default: .vcr_dof_quarantine",
+    )
+    parser.addini(
+        quarantine_dir_option,
+        default=".vcr_dof_quarantine",
+        help="The quarantine folder, relative to the rootdir (same as --vcr-dof-quarantine-dir).",
+    )
+    group.addoption(
+        "--vcr-dof-restore",
+        action="store",
+        nargs="?",
+        const="latest",
+        default=None,
+        dest=restore_option,
+        metavar="SESSION",
+        help="Move the cassettes of a quarantine session (by default the latest) back where they were, then exit.",
+    )
+    group.addoption(
+        "--vcr-dof-purge-quarantine",
+        action="store_true",
+        default=False,
+        dest=purge_option,
+        help="Delete the cassettes quarantined by previous sessions, in the background while the tests run.",
+    )
+    group.addoption(
+        "--vcr-dof-prune",
+        action="store_true",
+        default=False,
+        dest=prune_option,
+        help="Instead of deleting the cassettes of a failed test, remove only the interactions it appended to them.",
+    )
+    parser.addini(
+        prune_option,
+        type="bool",
+        default=False,
+        help="Prune the cassettes of failed tests instead of deleting them (same as --vcr-dof-prune).",
+    )
+    group.addoption(
+        "--vcr-dof-rerun-deleted",
+        action="store_true",
+        default=False,
+        dest=rerun_deleted_option,
+        help="Only run the tests whose cassettes have been deleted by previous sessions and not recorded again yet.",
+    )
+    group.addoption(
+        "--vcr-dof-target-workers",
+        action="store",
+        type=int,
+        default=None,
+        dest=target_workers_option,
+        metavar="N",
+        help="Evaluate the marker target callables in a pool of N threads. Default: 1, serially in the main thread.",
+    )
+    parser.addini(
+        target_workers_option,
+        default="1",
+        help="The number of threads evaluating the target callables (same as --vcr-dof-target-workers).",
+    )
+    group.addoption(
+        "--vcr-dof-target-timeout",
+        action="store",
+        type=float,
+        default=None,
+        dest=target_timeout_option,
+        metavar="SECONDS",
+        help="Give up on target callables not returning within this time: their cassettes will not be deleted.",
+    )
+    parser.addini(
+        target_timeout_option,
+        default=None,
+        help="The target callables timeout, in seconds (same as --vcr-dof-target-timeout).",
+    )
+    group.addoption(
+        "--vcr-dof-background-workers",
+        action="store",
+        type=int,
+        default=None,
+        dest=background_workers_option,
+        metavar="N",
+        help="Delete cassettes in N background threads, while the next tests run. Useful on slow filesystems."
+        " Default: 0, cassettes are deleted in the main thread.",
+    )
+    parser.addini(
+        background_workers_option,
+        default="0",
+        help="The number of threads deleting cassettes in the background (same as --vcr-dof-background-workers).",
+    )
+    group.addoption(
+        "--vcr-dof-min-failures",
+        action="store",
+        type=int,
+        default=None,
+        dest=min_failures_option,
+        metavar="N",
+        help="Delete cassettes only after N consecutive failures, counted across sessions in the pytest cache."
+        " Default: 1, cassettes are deleted at the first failure.",
+    )
+    parser.addini(
+        min_failures_option,
+        default="1",
+        help="The consecutive failures needed to delete a cassette (same as --vcr-dof-min-failures).",
+    )
+    group.addoption(
+        "--vcr-dof-budget",
+        action="store_true",
+        default=False,
+        dest=budget_option,
+        help="Measure the deleted cassettes and report how much it would take to record them again.",
+    )
+    parser.addini(
+        budget_option,
+        type="bool",
+        default=False,
+        help="Measure the deleted cassettes and report the re-record budget (same as --vcr-dof-budget).",
+    )
+    group.addoption(
+        "--vcr-dof-timings",
+        action="store_true",
+        default=False,
+        dest=timings_option,
+        help="Measure the time spent by the plugin and report it at the end of the session.",
+    )
+    parser.addini(
+        timings_option,
+        type="bool",
+        default=False,
+        help="Measure the time spent by the plugin (same as --vcr-dof-timings).",
+    )
+    group.addoption(
+        "--vcr-dof-timings-json",
+        action="store",
+        default=None,
+        dest=timings_json_option,
+        metavar="PATH",
+        help="Measure the time spent by the plugin and write it into a json file, relative to the rootdir.",
+    )
+    parser.addini(
+        timings_json_option,
+        default=None,
+        help="Write the time spent by the plugin into a json file (same as --vcr-dof-timings-json).",
+    )
+
+
+def get_quarantine_root(config: Config) -> str:
+    """Return the absolute path of the quarantine folder."""
+    folder = config.getoption(quarantine_dir_option) or config.getini(
+        quarantine_dir_option
+    )
+    return os.path.join(str(config.rootpath), folder)
+
+
+def is_option_enabled(config: Config, name: str) -> bool:
+    """Return True if a boolean option has been enabled either from the command line or from the ini file."""
+    return bool(config.getoption(name) or config.getini(name))
+
+
+def is_timings_enabled(config: Config) -> bool:
+    """Return True if the time spent by the plugin should be measured."""
+    return is_option_enabled(config, timings_option) or bool(
+        config.getoption(timings_json_option) or config.getini(timings_json_option)
+    )
+
+
+def get_number_option(
+    config: Config, name: str, convert: Callable[[Any], T], minimum: T
+) -> Optional[T]:
+    """Return the value of a numeric option from the command line or, if not used, from the ini file; None if it's
+    not set at all. Raise a UsageError if the value is not a number (converted with `convert`) or it's below minimum.
+    """
+    value = config.getoption(name)
+    if value is None:
+        value = config.getini(name)
+    if value is None or value == "":
+        return None
+    kind = "an integer" if convert is int else "a number"
+    try:
+        number = convert(value)
+    except (TypeError, ValueError):
+        raise pytest.UsageError(f"{name} must be {kind}, got {value!r}") from None
+    if number < minimum:  # type: ignore[operator]
+        raise pytest.UsageError(f"{name} must be {kind} >= {minimum}, got {value!r}")
+    return number
+
+
+def create_target_evaluator(config: Config) -> TargetEvaluator:
+    """Return a target evaluator configured with the command line or ini file options."""
+    workers = get_number_option(config, target_workers_option, int, 1)
+    timeout = get_number_option(config, target_timeout_option, float, 0.0)
+    return TargetEvaluator(workers=workers or 1, timeout=timeout or None)
+
+
+def create_deletion_worker(config: Config) -> Optional[DeletionWorker]:
+    """Return a background deletion worker if enabled by the command line or ini file options."""
+    workers = get_number_option(config, background_workers_option, int, 0)
+    return DeletionWorker(workers) if workers else None
+
+
+def get_min_failures(config: Config) -> int:
+    """Return the consecutive failures needed to delete a cassette, from the command line or ini file options."""
+    return get_number_option(config, min_failures_option, int, 1) or 1
+
+
+def create_recording_costs(config: Config) -> Optional[RecordingCosts]:
+    """Return the re-record costs known by the previous sessions if enabled by the command line or ini file options.
+    Without the pytest cache only the costs of this session are known."""
+    if not is_option_enabled(config, budget_option):
+        return None
+    cache = getattr(config, "cache", None)
+    if cache is None:
+        return RecordingCosts()
+    manifest: Dict[str, List[str]] = cache.get(manifest_cache_key, {})
+    return RecordingCosts(
+        cache.get(costs_cache_key, {}),
+        {
+            cassette: owners
+            for cassette, owners in manifest.items()
+            if not os.path.exists(cassette)
+        },
+    )
+
+
 def pytest_configure(config: Config) -> None:
+    xdist_worker = hasattr(config, "workerinput")
+    quarantine = None
+    if is_option_enabled(config, quarantine_option):
+        quarantine = Quarantine(get_quarantine_root(config), str(config.rootpath))
+    state = SessionState(
+        deferred=is_option_enabled(config, deferred_option),
+        xdist_worker=xdist_worker,
+        use_index=is_option_enabled(config, index_option),
+        quarantine=quarantine,
+        timings=Timings() if is_timings_enabled(config) else None,
+        target_evaluator=create_target_evaluator(config),
+        prune=is_option_enabled(config, prune_option),
+        deletion_worker=create_deletion_worker(config),
+        min_failures=get_min_failures(config),
+        costs=create_recording_costs(config),
+    )
+    config.stash[session_state_key] = state
+
+    if config.getoption(purge_option) and not xdist_worker:
+        state.purge_thread = threading.Thread(
+            target=purge_quarantine,
+            args=(get_quarantine_root(config), quarantine and quarantine.folder),
+            daemon=True,
+        )
+        state.purge_thread.start()
+
     config.addinivalue_line(
         "markers",
-        f"{marker_name}({target_str}, {delete_default_str}, {skip_str}"
+        f"{marker_name}({target_str}, {delete_default_str}, {skip_str}, {prune_str}, {scope_str},"
+        f" {delete_default_dir_str}, {min_failures_str}"
         f"): the cassette(s) to delete on text failure. {target_str}: T = TypeVar('T', None, str,"
         f" List[T], Callable[[Function], T]) is a possibly nested structure of lists and functions from which all str"
         f" will be extracted and treated as paths of cassettes to delete; the Function argument received by these"
         f" functions is a _pytest.python.Function. If no argument is passed to the marker the cassette will be"
         f" determined automatically. If the argument {delete_default_str}=True is used, the automatically determined"
         f" cassette will be deleted even when providing a {target_str}. If the argument {skip_str}=True"
-        f" is used or a None {target_str} is provided, no cassette will be deleted at all. This marker"
-        f" can be used multiple times.",
+        f" is used or a None {target_str} is provided, no cassette will be deleted at all. If the argument"
+        f" {prune_str}=True is used, only the interactions the test appended to its cassettes will be removed. If the"
+        f" argument {scope_str}='class'|'module'|'session' is used, the cassette(s) will be deleted only once per"
+        f" class, module or session, at the first failure. A '{auto_target}' {target_str} stands for every cassette"
+        f" vcrpy opened while the test was running. Directories are deleted with their whole content; if the argument"
+        f" {delete_default_dir_str}=True is used, the directory named after the default cassette (without extension)"
+        f" will be deleted as well. If the argument {min_failures_str}=N is used, the cassette(s) will be deleted"
+        f" only after N consecutive failures, counted across sessions. This marker can be used multiple times.",
     )
 
 
+def pytest_unconfigure(config: Config) -> None:
+    state = config.stash.get(session_state_key, None)
+    if state is None:
+        return
+    restore_cassette_load(state)
+    state.target_evaluator.shutdown()
+    if state.deletion_worker is not None:
+        # the session could have been interrupted before its end
+        state.deletion_worker.join()
+    if state.purge_thread is not None:
+        # make sure the quarantine purge is complete
+        state.purge_thread.join()
+
+
+def pytest_cmdline_main(config: Config) -> Optional[int]:
+    if config.getoption(restore_option) is not None:
+        return wrap_session(config, restore_quarantined_cassettes)
+    return None
+
+
+# noinspection PyUnusedLocal
+def restore_quarantined_cassettes(config: Config, session: Session) -> int:
+    """Restore the quarantine session chosen with --vcr-dof-restore, reporting what happened."""
+    tw = config.get_terminal_writer()
+    root = get_quarantine_root(config)
+    sessions = list_quarantine_sessions(root)
+    chosen = config.getoption(restore_option)
+    if chosen == "latest" and sessions:
+        chosen = sessions[-1]
+    if chosen not in sessions:
+        tw.line(f"No quarantine session found in {root}", red=True)
+        return 0
+
+    restored, skipped = restore_quarantine_session(root, str(config.rootpath), chosen)
+    tw.sep(
+        "-", f"restored {len(restored)} cassette(s) from quarantine session {chosen}"
+    )
+    for cassette in restored:
+        tw.line(cassette)
+    if skipped:
+        tw.sep("-", f"{len(skipped)} cassette(s) left in quarantine: they exist again")
+        for cassette in skipped:
+            tw.line(cassette)
+    return 0
+
+
 @contextmanager
 def delete_on_fail(
     cassettes: Optional[List[str]], skip: bool = False
@@ -267,12 +2520,17 @@ def delete_on_fail(
         yield
     except (Exception,) as e:
         if not skip and cassettes:
-            for cassette in cassettes:
-                if isinstance(cassette, str):
-                    delete_cassette(cassette)
+            delete_cassettes(cassettes)
         raise e
 
 
+def delete_cassettes(cassettes: List[str]) -> None:
+    """Delete the provided cassettes from disk, ignoring everything that is not a string."""
+    for cassette in cassettes:
+        if isinstance(cassette, str):
+            delete_cassette(cassette)
+
+
 @contextmanager
 def vcr_and_dof(
     vcr: VCR,
@@ -290,3 +2548,37 @@ def vcr_and_dof(
         cassette, **kwargs
     ) as v:
         yield v
+
+
+@asynccontextmanager
+async def async_delete_on_fail(
+    cassettes: Optional[List[str]], skip: bool = False
+) -> AsyncGenerator[None, None]:
+    """Asynchronous context manager that will delete the specified cassette(s) if an exception is raised. The deletion
+    runs in the default thread executor, so that the event loop is not blocked."""
+    try:
+        yield
+    except (Exception,) as e:
+        if not skip and cassettes:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, delete_cassettes, cassettes)
+        raise e
+
+
+@asynccontextmanager
+async def async_vcr_and_dof(
+    vcr: VCR,
+    cassette: str,
+    skip_delete: bool = False,
+    additional_delete: Optional[List[str]] = None,
+    **kwargs: Any,  # these are options passed on to use_cassette
+) -> AsyncGenerator[None, None]:
+    """Asynchronous context manager that acts as a wrapper for VCR.use_cassette and async_delete_on_fail: it allows to
+    record cassettes in async tests that will be deleted on failure without blocking the event loop.
+    """
+    cassettes = [cassette]
+    if additional_delete:
+        cassettes += additional_delete
+    async with async_delete_on_fail(cassettes, skip=skip_delete):
+        with vcr.use_cassette(cassette, **kwargs) as v:
+            yield v
@@ -0,0 +1,182 @@
+import os
+
+import pytest
+
+
+class TestACassetteIndex:
+    """Test: A cassette index..."""
+
+    #
+    #
+    #
+    def test_should_answer_from_memory_once_a_folder_is_listed(self, tmp_path):
+        """A cassette index should answer from memory once a folder is listed."""
+        from pytest_vcr_delete_on_fail import CassetteIndex
+
+        (tmp_path / "nested").mkdir()
+        (tmp_path / "a.yaml").write_text("a")
+        (tmp_path / "nested" / "b.yaml").write_text("bb")
+
+        index = CassetteIndex()
+        index.scan(str(tmp_path))
+        (tmp_path / "late.yaml").write_text("late")
+
+        assert index.get(str(tmp_path / "a.yaml")).size == 1
+        assert index.get(str(tmp_path / "nested" / "b.yaml")).size == 2
+        assert not index.exists(str(tmp_path / "missing.yaml"))
+        # files written after the scan are only seen after a refresh
+        assert not index.exists(str(tmp_path / "late.yaml"))
+        assert index.refresh(str(tmp_path / "late.yaml")).size == 4
+        assert {entry.path for entry in index.listdir(str(tmp_path))} == {
+            str(tmp_path / "a.yaml"),
+            str(tmp_path / "late.yaml"),
+        }
+
+        index.discard(str(tmp_path / "a.yaml"))
+        assert not index.exists(str(tmp_path / "a.yaml"))
+        # discarding a directory discards everything inside it
+        index.discard(str(tmp_path / "nested"))
+        assert not index.exists(str(tmp_path / "nested" / "b.yaml"))
+
+    #
+    #
+    #
+    def test_should_list_unknown_folders_on_demand(self, tmp_path, monkeypatch):
+        """A cassette index should list unknown folders on demand."""
+        from pytest_vcr_delete_on_fail import CassetteIndex
+
+        (tmp_path / "a.yaml").write_text("a")
+        monkeypatch.chdir(tmp_path)
+
+        index = CassetteIndex()
+
+        assert index.exists("a.yaml")
+        os.remove("a.yaml")
+        # the folder has already been listed
+        assert index.exists("a.yaml")
+
+    #
+    #
+    #
+    def test_should_list_a_folder_again_only_if_it_changed(self, tmp_path, monkeypatch):
+        """A cassette index should list a folder again only if it changed."""
+        from pytest_vcr_delete_on_fail import CassetteIndex
+
+        (tmp_path / "a.yaml").write_text("a")
+        listed = []
+        scandir = os.scandir
+        monkeypatch.setattr(
+            os, "scandir", lambda path: listed.append(path) or scandir(path)
+        )
+
+        index = CassetteIndex()
+        assert len(index.listdir(str(tmp_path), revalidate=True)) == 1
+        assert len(index.listdir(str(tmp_path), revalidate=True)) == 1
+        assert len(listed) == 1
+
+        (tmp_path / "b.yaml").write_text("b")
+        # without revalidation the index is a snapshot
+        assert len(index.listdir(str(tmp_path))) == 1
+        assert len(index.listdir(str(tmp_path), revalidate=True)) == 2
+        assert len(listed) == 2
+
+    #
+    #
+    #
+    def test_should_know_cassette_directories_and_revalidate_lookups(self, tmp_path):
+        """A cassette index should know cassette directories and revalidate lookups."""
+        from pytest_vcr_delete_on_fail import CassetteIndex
+
+        (tmp_path / "tree").mkdir()
+
+        index = CassetteIndex()
+        assert index.exists(str(tmp_path / "tree"))
+        assert index.get(str(tmp_path / "tree")) is None
+
+        (tmp_path / "late.yaml").write_text("late")
+        assert not index.exists(str(tmp_path / "late.yaml"))
+        assert index.exists(str(tmp_path / "late.yaml"), revalidate=True)
+        assert index.get(str(tmp_path / "late.yaml")).size == 4
+
+        index.discard(str(tmp_path / "tree"))
+        assert not index.exists(str(tmp_path / "tree"))
+
+    #
+    #
+    #
+    def test_should_be_available_to_target_callables(
+        self, add_test_file, run_tests, get_test_cassettes, pytester
+    ):
+        """A cassette index should be available to target callables."""
+        # language=python prefix="if True:" # IDE language injection
+        test_source = """
+            import os
+            import pytest
+            from pytest_vcr_delete_on_fail import get_cassette_index, get_default_cassette_path
+
+            def all_variants(item):
+                # every indexed file starting with the default cassette name
+                default = os.path.abspath(get_default_cassette_path(item))
+                index = get_cassette_index(item.config)
+                return [entry.path for entry in index.listdir(os.path.dirname(default))
+                        if entry.path.startswith(default)]
+
+            @pytest.mark.vcr_delete_on_fail.with_args(all_variants)
+            def test_this():
+                assert False  # intentional
+            """
+        test = add_test_file(test_source)
+        folder = pytester.path / "cassettes" / test.stem
+        folder.mkdir(parents=True)
+        for name in ["test_this.yaml.a", "test_this.yaml.b", "test_other.yaml"]:
+            (folder / name).write_text("cassette")
+
+        result = run_tests("--vcr-dof-index")
+
+        assert result.outcomes_are(failed=1)
+        assert result.has_fail_with_comment("intentional")
+        assert [c.name for c in get_test_cassettes(test)] == ["test_other.yaml"]
+
+    #
+    #
+    #
+    @pytest.mark.parametrize("mode", [[], ["--vcr-dof-deferred"]])
+    def test_should_be_used_to_delete_cassettes(
+        self, mode, add_test_file, run_tests, is_file, pytester
+    ):
+        """A cassette index should be used to delete cassettes."""
+        # language=python prefix="if True:" # IDE language injection
+        conftest_source = """
+            import os
+
+            original_remove = os.remove
+
+            def logged_remove(path, *args, **kwargs):
+                with open("removed", "a") as f:
+                    f.write(os.path.basename(path) + "\\n")
+                return original_remove(path, *args, **kwargs)
+
+            def pytest_configure(config):
+                os.remove = logged_remove
+
+            def pytest_unconfigure(config):
+                os.remove = original_remove
+            """
+        pytester.makeconftest(conftest_source)
+        # language=python prefix="if True:" # IDE language injection
+        test_source = """
+            import pytest
+
+            @pytest.mark.vcr_delete_on_fail(["cassettes/recorded.yaml", "cassettes/missing.yaml"])
+            def test_this():
+                # written after the index has been built
+                open("cassettes/recorded.yaml", "w").close()
+                assert False  # intentional
+            """
+        add_test_file(test_source)
+        pytester.mkdir("cassettes")
+
+        assert run_tests("--vcr-dof-index", *mode).outcomes_are(failed=1)
+        assert not is_file("cassettes/recorded.yaml")
+        # the index already knows the missing cassette is not there
+        assert (pytester.path / "removed").read_text().splitlines() == ["recorded.yaml"]
@@ -267,3 +267,90 @@ class TestAVcrAndDofContextManager:
         assert result.has_fail_with_comment("intentional fail")
         assert not is_file(custom_cassette_a)
         assert not is_file(custom_cassette_b)
+
+
+class TestTheAsyncContextManagers:
+    """Test: The async context managers..."""
+
+    def test_should_delete_cassettes_outside_the_event_loop_thread(
+        self, add_test_file, test_url, run_tests, is_file
+    ):
+        """The async context managers should delete cassettes outside the event loop thread."""
+        custom_cassette_a = "cassettes/custom_a.yaml"
+        custom_cassette_b = "cassettes/custom_b.yaml"
+
+        # language=python prefix="if True:" # IDE language injection
+        test_source = f"""
+            import asyncio
+            import threading
+            import pytest
+            import requests
+            import vcr
+            import pytest_vcr_delete_on_fail.main
+            from pytest_vcr_delete_on_fail import async_delete_on_fail, async_vcr_and_dof
+
+            my_vcr = vcr.VCR(record_mode="once")
+            deleting_threads = []
+
+            @pytest.fixture(autouse=True)
+            def spy_deletions(monkeypatch):
+                original = pytest_vcr_delete_on_fail.main.delete_cassette
+                def spy(cassette):
+                    deleting_threads.append(threading.current_thread())
+                    original(cassette)
+                monkeypatch.setattr(pytest_vcr_delete_on_fail.main, "delete_cassette", spy)
+
+            async def record_and_fail():
+                async with async_delete_on_fail(["{custom_cassette_a}"]):
+                    with my_vcr.use_cassette("{custom_cassette_a}"):
+                        requests.get("{test_url}")
+                    async with async_vcr_and_dof(my_vcr, "{custom_cassette_b}"):
+                        requests.get("{test_url}")
+                        assert False  # intentional fail
+
+            def test_this():
+                asyncio.run(record_and_fail())
+
+            def test_deletions_thread():
+                assert len(deleting_threads) == 2
+                assert threading.main_thread() not in deleting_threads
+            """
+
+        add_test_file(test_source)
+        result = run_tests()
+
+        assert result.outcomes_are(failed=1, passed=1)
+        assert result.has_fail_with_comment("intentional fail")
+        assert not is_file(custom_cassette_a)
+        assert not is_file(custom_cassette_b)
+
+    def test_should_allow_to_skip_the_cassette_deletion_on_failure(
+        self, add_test_file, test_url, run_tests, is_file
+    ):
+        """The async context managers should allow to skip the cassette deletion on failure."""
+        custom_cassette = "cassettes/custom.yaml"
+
+        # language=python prefix="if True:" # IDE language injection
+        test_source = f"""
+            import asyncio
+            import requests
+            import vcr
+            from pytest_vcr_delete_on_fail import async_vcr_and_dof
+
+            my_vcr = vcr.VCR(record_mode="once")
+
+            async def record_and_fail():
+                async with async_vcr_and_dof(my_vcr, "{custom_cassette}", skip_delete=True):
+                    requests.get("{test_url}")
+                    assert False  # intentional fail
+
+            def test_this():
+                asyncio.run(record_and_fail())
+            """
+
+        add_test_file(test_source)
+        result = run_tests()
+
+        assert result.outcomes_are(failed=1)
+        assert result.has_fail_with_comment("intentional fail")
+        assert is_file(custom_cassette)
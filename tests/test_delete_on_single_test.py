@@ -3,7 +3,7 @@ import pytest
 
 def test_the_path_list_parser_should_correctly_parse_all_accepted_input(request):
     """The path list parser should correctly parse all accepted input"""
-    from pytest_vcr_delete_on_fail.main import parse_target
+    from pytest_vcr_delete_on_fail.main import parse_target, TargetCallableWarning
     from _pytest.python import Function
     from typing import Union, List
 
@@ -35,7 +35,10 @@ def test_the_path_list_parser_should_correctly_parse_all_accepted_input(request)
         None,
     ]
 
-    result = parse_target(path_list, request.node)
+    # func_e is called 4 times: every failure is reported
+    with pytest.warns(TargetCallableWarning) as warnings:
+        result = parse_target(path_list, request.node)
+    assert len(warnings) == 4
 
     expected = {
         "a",
@@ -55,6 +58,31 @@ def test_the_path_list_parser_should_correctly_parse_all_accepted_input(request)
     assert expected == result
 
 
+def test_marker_arguments_should_be_parsed_once_per_mark(request):
+    """Marker arguments should be parsed once per mark"""
+    import pytest
+    from pytest_vcr_delete_on_fail.main import (
+        SessionState,
+        get_parsed_mark,
+        get_cassettes,
+    )
+
+    def func_a(node):
+        return [f"{node.name}_a", None]
+
+    mark = pytest.mark.vcr_delete_on_fail(["a", func_a, ["b", 42, None]]).mark
+    state = SessionState()
+
+    parsed = get_parsed_mark(state, mark)
+
+    assert get_parsed_mark(state, mark) is parsed
+    assert get_parsed_mark(state, pytest.mark.vcr_delete_on_fail.mark) is not parsed
+    assert parsed.static_cassettes == {"a", "b"}
+    assert parsed.dynamic_targets == [func_a]
+    assert not parsed.skip
+    assert get_cassettes(parsed, request.node) == {"a", "b", f"{request.node.name}_a"}
+
+
 def test_the_valid_target_type_should_be_public(
     add_test_file, default_conftest, test_url, run_tests, is_file
 ):
@@ -136,15 +164,32 @@ class TestWhenDealingWithASingleTest:
     #
     #
     #
-    def test_it_should_be_able_to_add_report_to_the_test_node(
-        self, add_test_file, run_tests
+    def test_it_should_be_able_to_record_the_phases_outcomes_of_the_test_node(
+        self, pytester, add_test_file, run_tests
     ):
-        """When dealing with a single test it should be able to add report to the test node."""
+        """When dealing with a single test it should be able to record the phases outcomes of the test node."""
+
+        # language=python prefix="if True:" # IDE language injection
+        conftest = """
+            import pytest
+            from pytest_vcr_delete_on_fail.main import phase_outcomes_key
+
+            # this runs inside the plugin protocol wrapper: the outcomes are still there
+            @pytest.hookimpl(hookwrapper=True, trylast=True)
+            def pytest_runtest_protocol(item, nextitem):
+                yield
+                outcomes = item.stash[phase_outcomes_key]
+                item.recorded_outcomes = (outcomes.setup, outcomes.call, outcomes.teardown)
+            """
+        pytester.makeconftest(conftest)
 
         # language=python prefix="if True:" # IDE language injection
         source = """
             import pytest
             
+            # results are only tracked for tests using the marker; None means no cassette will be deleted
+            pytestmark = pytest.mark.vcr_delete_on_fail(None)
+            
             @pytest.fixture
             def setup(request):
                 assert request.param
@@ -166,26 +211,17 @@ class TestWhenDealingWithASingleTest:
             def test_runner_report(setup, call, teardown):
                 assert call
             
-            # NOTE: this must be run together with and after test_runner_report since it checks the recorded reports
+            # NOTE: this must be run together with and after test_runner_report since it checks the recorded outcomes
             # on THAT parametric test
             @pytest.mark.order(2)
             def test_check_runners(request):
-                def get_reports(description):
+                def get_outcomes(description):
                     name = f"test_runner_report[{description[0]}-{description[1]}-{description[2]}]"
-                    return list(filter(lambda t: t.name == name, request.session.items))[0].reports
-                failed_on_setup = get_reports(fail_on_setup)
+                    return list(filter(lambda t: t.name == name, request.session.items))[0].recorded_outcomes
                 # These are flagged as skipped because of xfail
-                assert failed_on_setup["setup"].skipped
-                assert failed_on_setup["call"] is None
-                assert failed_on_setup["teardown"].passed
-                failed_on_call = get_reports(fail_on_call)
-                assert failed_on_call["setup"].passed
-                assert failed_on_call["call"].skipped
-                assert failed_on_call["teardown"].passed
-                failed_on_teardown = get_reports(fail_on_teardown)
-                assert failed_on_teardown["setup"].passed
-                assert failed_on_teardown["call"].passed
-                assert failed_on_teardown["teardown"].skipped
+                assert get_outcomes(fail_on_setup) == ("skipped", None, "passed")
+                assert get_outcomes(fail_on_call) == ("passed", "skipped", "passed")
+                assert get_outcomes(fail_on_teardown) == ("passed", "passed", "skipped")
                     """
 
         add_test_file(source)
@@ -514,7 +550,12 @@ class TestWhenDealingWithASingleTest:
                 assert False
             """
         add_test_file(test_source)
-        assert run_tests().outcomes_are(failed=1, errors=0)
+        result = run_tests()
+        assert result.outcomes_are(failed=1, errors=0)
+        # the failure is reported
+        result.stdout.fnmatch_lines(
+            ["*TargetCallableWarning*broken raised Exception()*"]
+        )
 
     #
     #
@@ -685,3 +726,152 @@ class TestWhenDealingWithASingleTest:
         assert result.has_fail_with_comment("intentional fail")
         assert not is_file(cassette_a)
         assert not get_test_cassettes(test)
+
+    #
+    #
+    #
+    def test_it_should_delete_the_cassettes_opened_by_the_test_with_the_auto_target(
+        self, add_test_file, test_url, run_tests, is_file
+    ):
+        """When dealing with a single test it should delete the cassettes opened by the test with the auto target."""
+        # language=python prefix="if True:" # IDE language injection
+        test_source = f"""
+            import pytest
+            import requests
+            import vcr
+
+            my_vcr = vcr.VCR(record_mode="once")
+
+            def helper(name):
+                # a helper opening its own cassette: the test doesn't know its path
+                with my_vcr.use_cassette(f"cassettes/helper_{{name}}.yaml"):
+                    requests.get("{test_url}")
+
+            @pytest.fixture
+            def unrelated():
+                open("cassettes/unrelated.yaml", "w").close()
+
+            @pytest.mark.vcr_delete_on_fail("auto")
+            def test_passing():
+                helper("passing")
+
+            @pytest.mark.vcr_delete_on_fail(target="auto")
+            def test_failing(unrelated):
+                with my_vcr.use_cassette("cassettes/failing.yaml"):
+                    requests.get("{test_url}")
+                helper("failing")
+                assert False  # intentional
+            """
+        add_test_file(test_source)
+
+        assert run_tests().outcomes_are(passed=1, failed=1)
+        assert is_file("cassettes/helper_passing.yaml")
+        assert is_file("cassettes/unrelated.yaml")
+        assert not is_file("cassettes/failing.yaml")
+        assert not is_file("cassettes/helper_failing.yaml")
+
+    #
+    #
+    #
+    def test_it_should_delete_cassette_directories_with_their_whole_content(
+        self, add_test_file, test_url, run_tests, is_file, get_test_cassettes
+    ):
+        """When dealing with a single test it should delete cassette directories with their whole content."""
+        # language=python prefix="if True:" # IDE language injection
+        test_source = f"""
+            import os
+            import pytest
+            import requests
+            import vcr
+            from pytest_vcr_delete_on_fail import get_default_cassette_dir
+
+            my_vcr = vcr.VCR(record_mode="once")
+
+            def record_tree(root):
+                for endpoint in ("users", "users/1", "users/1/repos"):
+                    with my_vcr.use_cassette(os.path.join(root, endpoint, "get.yaml")):
+                        requests.get("{test_url}")
+
+            @pytest.mark.vcr_delete_on_fail(delete_default_dir=True)
+            def test_default_dir(request):
+                record_tree(get_default_cassette_dir(request.node))
+                assert False  # intentional
+
+            @pytest.mark.vcr_delete_on_fail("cassettes/tree")
+            def test_target_dir():
+                record_tree("cassettes/tree")
+                assert False  # intentional
+
+            @pytest.mark.vcr_delete_on_fail("cassettes/kept")
+            def test_passing():
+                record_tree("cassettes/kept")
+            """
+        test = add_test_file(test_source)
+
+        assert run_tests().outcomes_are(failed=2, passed=1)
+        assert not get_test_cassettes(test)
+        assert not is_file("cassettes/tree/users/get.yaml")
+        assert is_file("cassettes/kept/users/1/repos/get.yaml")
+
+
+def test_unmarked_tests_should_not_be_tracked(add_test_file, run_tests):
+    """Unmarked tests should not be tracked"""
+    # language=python prefix="if True:" # IDE language injection
+    source = """
+        import pytest
+        from pytest_vcr_delete_on_fail.main import phase_outcomes_key
+
+        @pytest.mark.order(1)
+        def test_unmarked():
+            assert True
+
+        @pytest.mark.order(2)
+        @pytest.mark.vcr_delete_on_fail(None)
+        def test_marked():
+            assert True
+
+        @pytest.mark.order(3)
+        def test_check_tracking(request):
+            # the outcomes are released as soon as the plugin is done with a test
+            for item in request.session.items[:2]:
+                assert phase_outcomes_key not in item.stash
+                assert not hasattr(item, "reports")
+        """
+    add_test_file(source)
+    assert run_tests().outcomes_are(passed=3)
+
+
+def test_failed_tests_reports_should_not_be_retained(pytester, add_test_file):
+    """Failed tests reports should not be retained"""
+    # language=python prefix="if True:" # IDE language injection
+    conftest = """
+        import tracemalloc
+        import pytest
+
+        def pytest_configure(config):
+            tracemalloc.start()
+
+        @pytest.hookimpl(trylast=True)
+        def pytest_sessionfinish(session):
+            with open("traced_memory", "w") as f:
+                f.write(str(tracemalloc.get_traced_memory()[0]))
+        """
+    pytester.makeconftest(conftest)
+    # language=python prefix="if True:" # IDE language injection
+    source = """
+        import pytest
+
+        @pytest.mark.vcr_delete_on_fail(None)
+        @pytest.mark.parametrize("n", range(200))
+        def test_this(n):
+            pytest.fail("x" * 200_000)  # intentional
+        """
+    add_test_file(source)
+    # without a terminal reporter nobody else keeps the failed reports, along with their failure message, around;
+    # pytest-rerunfailures would keep the exceptions instead
+    result = pytester.runpytest_subprocess(
+        "-p", "no:terminal", "-p", "no:cacheprovider", "-p", "no:rerunfailures"
+    )
+    assert result.ret == pytest.ExitCode.TESTS_FAILED
+    # retaining the reports would take more than 200 * 200KB = 40MB
+    assert int((pytester.path / "traced_memory").read_text()) < 10 * 1024 * 1024
@@ -152,6 +152,9 @@ class TestATestCollections:
             from _pytest.python import Function
             from pytest_vcr_delete_on_fail import has_class_scoped_setup_failed, has_class_scoped_teardown_failed
             
+            # results are only tracked for tests using the marker; None means no cassette will be deleted
+            pytestmark = pytest.mark.vcr_delete_on_fail(None)
+            
             @pytest.mark.order(1)
             class TestSetToPass:
                 @pytest.fixture(scope="class", autouse=True)
@@ -192,18 +195,276 @@ class TestATestCollections:
             @pytest.mark.order(4)
             def test_class_tags(get_session_test_by_name):
                 passed = get_session_test_by_name("test_should_pass")
-                assert not passed.cls.cls_setup_failed
-                assert not passed.cls.cls_teardown_failed
                 assert not has_class_scoped_setup_failed(passed)
                 assert not has_class_scoped_teardown_failed(passed)
                 
                 failed_setup = get_session_test_by_name("test_should_fail_at_class_setup")
-                assert failed_setup.cls.cls_setup_failed
                 assert has_class_scoped_setup_failed(failed_setup)
+                assert not has_class_scoped_teardown_failed(failed_setup)
                 
                 failed_teardown = get_session_test_by_name("test_should_fail_at_class_teardown")
-                assert failed_teardown.cls.cls_teardown_failed
                 assert has_class_scoped_teardown_failed(failed_teardown)
+                assert not has_class_scoped_setup_failed(failed_teardown)
+                # nothing is stored on the user classes
+                assert not [name for name in vars(failed_setup.cls) if name.startswith("cls_")]
             """
         add_test_file(test_source)
         assert run_tests().outcomes_are(xfailed=2, xpassed=1, passed=2)
+
+    #
+    #
+    #
+    def test_should_tag_class_scoped_fixtures_regardless_of_how_they_are_declared(
+        self, add_test_file, run_tests
+    ):
+        """A test collections should tag class scoped fixtures regardless of how they are declared."""
+        # language=python prefix="if True:" # IDE language injection
+        test_source = """
+            import functools
+            import pytest
+            from _pytest.python import Function
+            from pytest_vcr_delete_on_fail import has_class_scoped_setup_failed, has_class_scoped_teardown_failed
+
+            CLASS_SCOPE = "class"
+
+            def class_fixture(func):
+                # a custom fixture decorator, wrapping the fixture function
+                @functools.wraps(func)
+                def wrapper(*args, **kwargs):
+                    return func(*args, **kwargs)
+                return pytest.fixture(scope=CLASS_SCOPE, autouse=True)(wrapper)
+
+            # results are only tracked for tests using the marker; None means no cassette will be deleted
+            pytestmark = pytest.mark.vcr_delete_on_fail(None)
+
+            @pytest.mark.order(1)
+            class TestScopeFromVariable:
+                @pytest.fixture(scope=CLASS_SCOPE, autouse=True)
+                def setup_phase(self):
+                    raise Exception
+                @pytest.mark.xfail
+                def test_should_fail_at_class_setup(self):
+                    pass
+
+            @pytest.mark.order(2)
+            class TestWrappedFixture:
+                @class_fixture
+                def setup_phase(self):
+                    raise Exception
+                @pytest.mark.xfail
+                def test_should_fail_at_wrapped_class_setup(self):
+                    pass
+
+            @pytest.mark.order(3)
+            class TestFunctionScopedFixture:
+                @pytest.fixture(autouse=True)
+                def setup_phase(self):
+                    raise Exception
+                @pytest.mark.xfail
+                def test_should_fail_at_function_setup(self):
+                    pass
+
+            @pytest.fixture
+            def get_session_test_by_name(request):
+                def _get_session_test_by_name(name: str) -> Function:
+                    return next(filter(lambda x: x.name == name, request.session.items))
+                return _get_session_test_by_name
+
+            @pytest.mark.order(4)
+            def test_class_tags(get_session_test_by_name):
+                assert has_class_scoped_setup_failed(get_session_test_by_name("test_should_fail_at_class_setup"))
+                assert has_class_scoped_setup_failed(
+                    get_session_test_by_name("test_should_fail_at_wrapped_class_setup"))
+                assert not has_class_scoped_setup_failed(get_session_test_by_name("test_should_fail_at_function_setup"))
+            """
+        add_test_file(test_source)
+        assert run_tests().outcomes_are(xfailed=3, passed=1)
+
+    #
+    #
+    #
+    def test_should_tag_parametrized_and_inherited_classes_separately(
+        self, add_test_file, run_tests
+    ):
+        """A test collections should tag parametrized and inherited classes separately."""
+        # language=python prefix="if True:" # IDE language injection
+        test_source = """
+            import pytest
+            from pytest_vcr_delete_on_fail import has_class_scoped_setup_failed
+
+            # results are only tracked for tests using the marker; None means no cassette will be deleted
+            pytestmark = pytest.mark.vcr_delete_on_fail(None)
+
+            @pytest.mark.order(1)
+            class TestParametrized:
+                @pytest.fixture(scope="class", autouse=True, params=["broken", "working"])
+                def setup_phase(self, request):
+                    assert request.param == "working"
+                @pytest.mark.xfail
+                def test_this(self):
+                    pass
+
+            @pytest.mark.order(2)
+            class TestParent:
+                @pytest.fixture(scope="class", autouse=True)
+                def setup_phase(self):
+                    raise Exception
+                @pytest.mark.xfail
+                def test_inherited(self):
+                    pass
+
+            @pytest.mark.order(3)
+            class TestChild(TestParent):
+                @pytest.fixture(scope="class", autouse=True)
+                def setup_phase(self):
+                    pass
+
+            @pytest.mark.order(4)
+            def test_class_tags(request):
+                items = {item.nodeid.split("::", 1)[1]: item for item in request.session.items}
+                assert has_class_scoped_setup_failed(items["TestParametrized::test_this[broken]"])
+                assert not has_class_scoped_setup_failed(items["TestParametrized::test_this[working]"])
+                assert has_class_scoped_setup_failed(items["TestParent::test_inherited"])
+                assert not has_class_scoped_setup_failed(items["TestChild::test_inherited"])
+            """
+        add_test_file(test_source)
+        assert run_tests().outcomes_are(xfailed=2, xpassed=2, passed=1)
+
+    #
+    #
+    #
+    def test_should_tag_failed_module_or_session_setup_or_teardown(
+        self, add_test_file, run_tests
+    ):
+        """A test collections should tag failed module or session setup or teardown."""
+        # language=python prefix="if True:" # IDE language injection
+        test_source = """
+            import pytest
+
+            # results are only tracked for tests using the marker; None means no cassette will be deleted
+            pytestmark = pytest.mark.vcr_delete_on_fail(None)
+
+            @pytest.fixture(scope="session")
+            def broken_session():
+                raise Exception
+
+            @pytest.fixture(scope="module")
+            def broken_module_teardown():
+                yield
+                raise Exception
+
+            def test_should_fail_at_session_setup(broken_session):
+                pass
+
+            def test_should_fail_at_module_teardown(broken_module_teardown):
+                pass
+            """
+        add_test_file(test_source)
+        # language=python prefix="if True:" # IDE language injection
+        check_source = """
+            from pytest_vcr_delete_on_fail import (
+                has_class_scoped_setup_failed,
+                has_module_scoped_setup_failed,
+                has_module_scoped_teardown_failed,
+                has_session_scoped_setup_failed,
+                has_session_scoped_teardown_failed,
+            )
+
+            def test_scope_tags(request):
+                session_setup, module_teardown = request.session.items[:2]
+                assert has_session_scoped_setup_failed(session_setup)
+                assert not has_module_scoped_setup_failed(session_setup)
+                assert not has_class_scoped_setup_failed(session_setup)
+                assert has_module_scoped_teardown_failed(module_teardown)
+                assert not has_session_scoped_teardown_failed(module_teardown)
+                # the module scoped failure belongs to that module only
+                assert not has_module_scoped_teardown_failed(request.node)
+            """
+        add_test_file(check_source)
+        assert run_tests().outcomes_are(errors=2, passed=2)
+
+    #
+    #
+    #
+    @pytest.mark.parametrize(
+        "scope,calls,kept",
+        [
+            ("module", ["test_this[0]", "test_this[0]"], False),
+            # the cassette recorded again by the second module is not deleted again
+            ("session", ["test_this[0]"], True),
+        ],
+    )
+    def test_should_delete_scoped_cassettes_once_per_scope(
+        self, scope, calls, kept, add_test_file, test_url, run_tests, pytester, is_file
+    ):
+        """A test collections should delete scoped cassettes once per scope."""
+        shared = "cassettes/shared.yaml"
+
+        # the same marker is shared by both modules
+        # language=python prefix="if True:" # IDE language injection
+        marks_source = f"""
+            import pytest
+
+            def shared(item):
+                with open("calls", "a") as f:
+                    f.write(item.name + "\\n")
+                return "{shared}"
+
+            shared_mark = pytest.mark.vcr_delete_on_fail(shared, scope="{scope}")
+            """
+        pytester.makepyfile(marks=marks_source)
+        # language=python prefix="if True:" # IDE language injection
+        test_source = f"""
+            import pytest
+            import requests
+            import vcr
+            from marks import shared_mark
+
+            my_vcr = vcr.VCR(record_mode="once")
+
+            pytestmark = shared_mark
+
+            @pytest.fixture(scope="module")
+            def recorded():
+                with my_vcr.use_cassette("{shared}"):
+                    requests.get("{test_url}")
+                raise Exception  # intentional
+
+            @pytest.mark.parametrize("n", range(5))
+            def test_this(n, recorded):
+                pass
+            """
+        add_test_file(test_source)
+        add_test_file(test_source)
+        assert run_tests().outcomes_are(errors=10)
+
+        assert is_file(shared) == kept
+        # the target is resolved once per scope, by its first failed test
+        assert (pytester.path / "calls").read_text().splitlines() == calls
+
+    #
+    #
+    #
+    def test_should_refuse_an_invalid_scope_before_running_any_test(
+        self, add_test_file, run_tests
+    ):
+        """A test collections should refuse an invalid scope before running any test."""
+        # language=python prefix="if True:" # IDE language injection
+        test_source = """
+            import pytest
+
+            def test_first():
+                pass
+
+            @pytest.mark.vcr_delete_on_fail("cassettes/shared.yaml", scope="modul")
+            def test_second():
+                pass
+            """
+        add_test_file(test_source)
+        result = run_tests()
+
+        assert result.ret == pytest.ExitCode.USAGE_ERROR
+        result.stderr.fnmatch_lines(
+            ["ERROR: *::test_second: vcr_delete_on_fail scope must be one of: *"]
+        )
+        assert "INTERNALERROR" not in result.stdout.str() + result.stderr.str()
@@ -0,0 +1,814 @@
+import json
+import os
+
+import pytest
+import yaml
+
+# language=python prefix="if True:" # IDE language injection
+deferred_test = """
+    import os
+    import pytest
+    import requests
+    from pytest_vcr_delete_on_fail import get_default_cassette_path
+
+    @pytest.mark.order(1)
+    @pytest.mark.vcr
+    @pytest.mark.vcr_delete_on_fail
+    def test_first():
+        requests.get("{url}")
+        assert False  # intentional
+
+    @pytest.mark.order(2)
+    @pytest.mark.vcr
+    @pytest.mark.vcr_delete_on_fail
+    def test_second():
+        requests.get("{url}")
+        assert False  # intentional
+
+    @pytest.mark.order(3)
+    def test_cassettes_are_still_there(request):
+        for item in request.session.items[:2]:
+            assert os.path.exists(get_default_cassette_path(item))
+    """
+
+
+class TestTheDeferredMode:
+    """Test: The deferred mode..."""
+
+    #
+    #
+    #
+    @pytest.mark.parametrize(
+        "enabler",
+        ["option", "ini"],
+    )
+    def test_should_delete_cassettes_only_at_the_end_of_the_session(
+        self,
+        enabler,
+        pytester,
+        add_test_file,
+        default_conftest,
+        test_url,
+        run_tests,
+        get_test_cassettes,
+    ):
+        """The deferred mode should delete cassettes only at the end of the session."""
+        test = add_test_file(deferred_test.format(url=test_url))
+        args = []
+        if enabler == "option":
+            args.append("--vcr-dof-deferred")
+        else:
+            pytester.makeini("[pytest]\nvcr_dof_deferred = true")
+        result = run_tests(*args)
+
+        assert result.outcomes_are(failed=2, passed=1)
+        assert result.has_fail_with_comment("intentional")
+        assert not get_test_cassettes(test)
+
+    #
+    #
+    #
+    def test_should_delete_a_shared_cassette_only_once(
+        self, add_test_file, test_url, run_tests, is_file
+    ):
+        """The deferred mode should delete a shared cassette only once."""
+        shared = "cassettes/shared.yaml"
+
+        # language=python prefix="if True:" # IDE language injection
+        test_source = f"""
+            import pytest
+            import requests
+            import vcr
+
+            my_vcr = vcr.VCR(record_mode="once")
+
+            pytestmark = pytest.mark.vcr_delete_on_fail("{shared}")
+
+            @pytest.mark.parametrize("n", range(10))
+            def test_this(n):
+                with my_vcr.use_cassette("{shared}"):
+                    requests.get("{test_url}")
+                assert False  # intentional
+            """
+        add_test_file(test_source)
+        result = run_tests("--vcr-dof-deferred")
+
+        assert result.outcomes_are(failed=10)
+        assert not is_file(shared)
+
+
+class TestWithPytestXdist:
+    """Test: With pytest-xdist..."""
+
+    @pytest.fixture(autouse=True)
+    def require_xdist(self):
+        pytest.importorskip("xdist")
+
+    #
+    #
+    #
+    def test_workers_should_let_the_controller_delete_cassettes(
+        self, add_test_file, default_conftest, test_url, run_tests, get_test_cassettes
+    ):
+        """With pytest-xdist workers should let the controller delete cassettes."""
+        test = add_test_file(deferred_test.format(url=test_url))
+        # a single worker guarantees the tests order, while still going through the controller
+        result = run_tests("-n", "1")
+
+        assert result.outcomes_are(failed=2, passed=1)
+        assert not get_test_cassettes(test)
+
+    #
+    #
+    #
+    def test_a_shared_cassette_should_be_deleted_once_all_workers_are_done(
+        self, add_test_file, test_url, run_tests, is_file
+    ):
+        """With pytest-xdist a shared cassette should be deleted once all workers are done."""
+        shared = "cassettes/shared.yaml"
+
+        # language=python prefix="if True:" # IDE language injection
+        test_source = f"""
+            import pytest
+            import requests
+            import vcr
+
+            my_vcr = vcr.VCR(record_mode="once")
+
+            pytestmark = pytest.mark.vcr_delete_on_fail("{shared}")
+
+            @pytest.mark.parametrize("n", range(8))
+            def test_this(n):
+                with my_vcr.use_cassette("{shared}"):
+                    requests.get("{test_url}")
+                assert False  # intentional
+            """
+        add_test_file(test_source)
+        result = run_tests("-n", "2")
+
+        assert result.outcomes_are(failed=8)
+        assert not is_file(shared)
+
+
+# language=python prefix="if True:" # IDE language injection
+quarantine_test = """
+    import pytest
+    import requests
+
+    @pytest.mark.vcr
+    @pytest.mark.vcr_delete_on_fail
+    def test_this():
+        requests.get("{url}")
+        assert False  # intentional
+    """
+
+
+class TestTheQuarantineMode:
+    """Test: The quarantine mode..."""
+
+    @pytest.fixture
+    def quarantine(self, pytester):
+        return pytester.path / ".vcr_dof_quarantine"
+
+    #
+    #
+    #
+    def test_should_move_cassettes_aside_instead_of_deleting_them(
+        self,
+        add_test_file,
+        default_conftest,
+        test_url,
+        run_tests,
+        get_test_cassettes,
+        quarantine,
+    ):
+        """The quarantine mode should move cassettes aside instead of deleting them."""
+        test = add_test_file(quarantine_test.format(url=test_url))
+        result = run_tests("--vcr-dof-quarantine")
+
+        assert result.outcomes_are(failed=1)
+        assert not get_test_cassettes(test)
+        sessions = list(quarantine.iterdir())
+        assert len(sessions) == 1
+        assert (
+            sessions[0] / "rootdir" / "cassettes" / test.stem / "test_this.yaml"
+        ).is_file()
+
+    #
+    #
+    #
+    def test_should_merge_a_directory_quarantined_more_than_once(
+        self, add_test_file, run_tests, is_file, quarantine
+    ):
+        """The quarantine mode should merge a directory quarantined more than once."""
+        # language=python prefix="if True:" # IDE language injection
+        test_source = """
+            import os
+            import pytest
+
+            @pytest.mark.vcr_delete_on_fail("cassettes/tree")
+            @pytest.mark.parametrize("endpoint", ["users", "repos"])
+            def test_this(endpoint):
+                os.makedirs(f"cassettes/tree/{endpoint}", exist_ok=True)
+                for name in ["get.yaml", f"{endpoint}.yaml"]:
+                    with open(f"cassettes/tree/{endpoint}/{name}", "w") as f:
+                        f.write(endpoint)
+                with open("cassettes/tree/index.yaml", "w") as f:
+                    f.write(endpoint)
+                assert False  # intentional
+            """
+        add_test_file(test_source)
+        result = run_tests("--vcr-dof-quarantine")
+
+        assert result.outcomes_are(failed=2)
+        assert not is_file("cassettes/tree")
+        tree = next(quarantine.iterdir()) / "rootdir" / "cassettes" / "tree"
+        assert sorted(str(path.relative_to(tree)) for path in tree.rglob("*.yaml")) == [
+            "index.yaml",
+            "repos/get.yaml",
+            "repos/repos.yaml",
+            "users/get.yaml",
+            "users/users.yaml",
+        ]
+        # the files found in both are replaced by the latest ones
+        assert (tree / "index.yaml").read_text() == "repos"
+
+    #
+    #
+    #
+    def test_should_be_able_to_restore_quarantined_cassettes(
+        self,
+        add_test_file,
+        default_conftest,
+        test_url,
+        run_tests,
+        get_test_cassettes,
+        quarantine,
+    ):
+        """The quarantine mode should be able to restore quarantined cassettes."""
+        test = add_test_file(quarantine_test.format(url=test_url))
+        assert run_tests("--vcr-dof-quarantine").outcomes_are(failed=1)
+
+        result = run_tests("--vcr-dof-restore")
+
+        assert result.ret == 0
+        assert [c.name for c in get_test_cassettes(test)] == ["test_this.yaml"]
+        assert not list(quarantine.iterdir())
+
+    #
+    #
+    #
+    def test_should_purge_previous_sessions_in_the_background(
+        self,
+        add_test_file,
+        default_conftest,
+        test_url,
+        run_tests,
+        quarantine,
+    ):
+        """The quarantine mode should purge previous sessions in the background."""
+        old_session = quarantine / "20000101-000000-1" / "rootdir"
+        old_session.mkdir(parents=True)
+        (old_session / "old.yaml").write_text("old")
+        add_test_file(quarantine_test.format(url=test_url))
+
+        result = run_tests("--vcr-dof-quarantine", "--vcr-dof-purge-quarantine")
+
+        assert result.outcomes_are(failed=1)
+        sessions = list(quarantine.iterdir())
+        assert len(sessions) == 1
+        assert sessions[0].name != "20000101-000000-1"
+
+
+# language=python prefix="if True:" # IDE language injection
+rerun_test = """
+    import os
+    import pytest
+    import requests
+
+    @pytest.mark.vcr
+    @pytest.mark.vcr_delete_on_fail
+    def test_broken():
+        requests.get("{url}")
+        assert os.path.exists("fixed")  # intentional
+
+    @pytest.mark.vcr
+    @pytest.mark.vcr_delete_on_fail
+    def test_working():
+        requests.get("{url}")
+
+    def test_unmarked():
+        pass
+    """
+
+
+class TestTheRerunDeletedMode:
+    """Test: The rerun deleted mode..."""
+
+    #
+    #
+    #
+    @pytest.mark.parametrize("first_run", [[], ["--vcr-dof-deferred"], ["-n", "2"]])
+    def test_should_only_run_tests_whose_cassettes_were_deleted(
+        self,
+        first_run,
+        pytester,
+        add_test_file,
+        default_conftest,
+        test_url,
+        run_tests,
+        get_test_cassettes,
+    ):
+        """The rerun deleted mode should only run tests whose cassettes were deleted."""
+        if "-n" in first_run:
+            pytest.importorskip("xdist")
+        test = add_test_file(rerun_test.format(url=test_url))
+        assert run_tests(*first_run).outcomes_are(failed=1, passed=2)
+        assert [cassette.name for cassette in get_test_cassettes(test)] == [
+            "test_working.yaml"
+        ]
+
+        # the broken test gets fixed: only it is run to record its cassette again
+        (pytester.path / "fixed").touch()
+        result = run_tests("--vcr-dof-rerun-deleted")
+        assert result.outcomes_are(passed=1)
+        assert result.parseoutcomes()["deselected"] == 2
+        assert len(get_test_cassettes(test)) == 2
+
+        # every cassette has been recorded again: nothing left to run
+        result = run_tests("--vcr-dof-rerun-deleted")
+        assert result.parseoutcomes()["deselected"] == 3
+
+
+# language=python prefix="if True:" # IDE language injection
+min_failures_test = """
+    import os
+    import pytest
+    import requests
+
+    @pytest.mark.vcr
+    @pytest.mark.vcr_delete_on_fail{marker_args}
+    def test_flaky():
+        requests.get("{url}")
+        assert os.path.exists("fixed")  # intentional
+    """
+
+
+class TestTheFailuresThreshold:
+    """Test: The failures threshold..."""
+
+    #
+    #
+    #
+    @pytest.mark.parametrize(
+        "marker_args,enabler",
+        [
+            ("(min_failures=2)", []),
+            ("", ["--vcr-dof-min-failures=2"]),
+            ("", ["-n", "1", "--vcr-dof-min-failures=2"]),
+        ],
+    )
+    def test_should_delete_cassettes_only_after_consecutive_failures(
+        self,
+        marker_args,
+        enabler,
+        pytester,
+        add_test_file,
+        default_conftest,
+        test_url,
+        run_tests,
+        get_test_cassettes,
+    ):
+        """The failures threshold should delete cassettes only after consecutive failures."""
+        if "-n" in enabler:
+            pytest.importorskip("xdist")
+        test = add_test_file(
+            min_failures_test.format(marker_args=marker_args, url=test_url)
+        )
+        assert run_tests(*enabler).outcomes_are(failed=1)
+        assert len(get_test_cassettes(test)) == 1
+
+        # a pass resets the counter
+        (pytester.path / "fixed").touch()
+        assert run_tests(*enabler).outcomes_are(passed=1)
+        (pytester.path / "fixed").unlink()
+        assert run_tests(*enabler).outcomes_are(failed=1)
+        assert len(get_test_cassettes(test)) == 1
+
+        assert run_tests(*enabler).outcomes_are(failed=1)
+        assert not get_test_cassettes(test)
+
+        # the counter starts over once the cassette is deleted
+        assert run_tests(*enabler).outcomes_are(failed=1)
+        assert len(get_test_cassettes(test)) == 1
+
+    #
+    #
+    #
+    def test_should_count_a_shared_cassette_failure_once_per_session(
+        self, add_test_file, test_url, run_tests, is_file
+    ):
+        """The failures threshold should count a shared cassette failure once per session."""
+        shared = "cassettes/shared.yaml"
+
+        # language=python prefix="if True:" # IDE language injection
+        test_source = f"""
+            import pytest
+            import requests
+            import vcr
+
+            my_vcr = vcr.VCR(record_mode="once")
+
+            pytestmark = pytest.mark.vcr_delete_on_fail("{shared}", min_failures=2)
+
+            @pytest.mark.parametrize("n", range(3))
+            def test_this(n):
+                with my_vcr.use_cassette("{shared}"):
+                    requests.get("{test_url}")
+                assert False  # intentional
+            """
+        add_test_file(test_source)
+
+        assert run_tests().outcomes_are(failed=3)
+        assert is_file(shared)
+        assert run_tests().outcomes_are(failed=3)
+        assert not is_file(shared)
+
+    #
+    #
+    #
+    def test_should_delete_at_the_first_failure_without_the_pytest_cache(
+        self, add_test_file, default_conftest, test_url, run_tests, get_test_cassettes
+    ):
+        """The failures threshold should delete at the first failure without the pytest cache."""
+        test = add_test_file(
+            min_failures_test.format(marker_args="(min_failures=2)", url=test_url)
+        )
+        assert run_tests("-p", "no:cacheprovider").outcomes_are(failed=1)
+        assert not get_test_cassettes(test)
+
+    #
+    #
+    #
+    @pytest.mark.parametrize("min_failures", ["0", "True", "'3'"])
+    def test_should_refuse_an_invalid_threshold_before_running_any_test(
+        self, min_failures, add_test_file, run_tests
+    ):
+        """The failures threshold should refuse an invalid threshold before running any test."""
+        add_test_file(
+            min_failures_test.format(
+                marker_args=f"(min_failures={min_failures})", url=""
+            )
+        )
+        result = run_tests()
+
+        assert result.ret == pytest.ExitCode.USAGE_ERROR
+        result.stderr.fnmatch_lines(
+            [
+                "ERROR: *::test_flaky: vcr_delete_on_fail min_failures must be a positive integer"
+            ]
+        )
+        assert "INTERNALERROR" not in result.stdout.str() + result.stderr.str()
+
+    #
+    #
+    #
+    @pytest.mark.parametrize("min_failures", ["three", "0"])
+    def test_should_refuse_an_invalid_threshold_option(
+        self, min_failures, add_test_file, run_tests, pytester
+    ):
+        """The failures threshold should refuse an invalid threshold option."""
+        add_test_file("def test_this():\n    pass\n")
+        pytester.makeini(f"[pytest]\nvcr_dof_min_failures = {min_failures}")
+        result = run_tests()
+
+        assert result.ret == pytest.ExitCode.USAGE_ERROR
+        result.stderr.fnmatch_lines(["ERROR: vcr_dof_min_failures must be an integer*"])
+        assert "INTERNALERROR" not in result.stdout.str() + result.stderr.str()
+
+
+class TestThePruneMode:
+    """Test: The prune mode..."""
+
+    #
+    #
+    #
+    def test_should_only_remove_the_interactions_appended_by_the_failed_test(
+        self, add_test_file, test_url, run_tests, pytester
+    ):
+        """The prune mode should only remove the interactions appended by the failed test."""
+        shared = "cassettes/shared.yaml"
+
+        # language=python prefix="if True:" # IDE language injection
+        test_source = f"""
+            import pytest
+            import requests
+            import vcr
+
+            my_vcr = vcr.VCR(record_mode="new_episodes")
+
+            pytestmark = pytest.mark.vcr_delete_on_fail("{shared}", prune=True)
+
+            @pytest.mark.order(1)
+            def test_first():
+                with my_vcr.use_cassette("{shared}"):
+                    requests.get("{test_url}?first")
+
+            @pytest.mark.order(2)
+            def test_second():
+                with my_vcr.use_cassette("{shared}"):
+                    requests.get("{test_url}?first")
+                    requests.get("{test_url}?second")
+                assert False  # intentional
+            """
+        add_test_file(test_source)
+        assert run_tests().outcomes_are(passed=1, failed=1)
+
+        interactions = yaml.safe_load((pytester.path / shared).read_text())[
+            "interactions"
+        ]
+        assert [i["request"]["uri"] for i in interactions] == [f"{test_url}?first"]
+
+    #
+    #
+    #
+    @pytest.mark.parametrize("mode", [[], ["--vcr-dof-deferred"], ["-n", "1"]])
+    def test_should_delete_cassettes_recorded_from_scratch_or_never_loaded(
+        self,
+        mode,
+        pytester,
+        add_test_file,
+        default_conftest,
+        test_url,
+        run_tests,
+        is_file,
+    ):
+        """The prune mode should delete cassettes recorded from scratch or never loaded."""
+        if "-n" in mode:
+            pytest.importorskip("xdist")
+        # language=python prefix="if True:" # IDE language injection
+        test_source = f"""
+            import pytest
+            import requests
+
+            @pytest.fixture
+            def unrelated():
+                open("unrelated.yaml", "w").close()
+
+            @pytest.mark.vcr
+            @pytest.mark.vcr_delete_on_fail
+            @pytest.mark.vcr_delete_on_fail("unrelated.yaml")
+            def test_this(unrelated):
+                requests.get("{test_url}")
+                assert False  # intentional
+            """
+        test = add_test_file(test_source)
+        assert run_tests("--vcr-dof-prune", *mode).outcomes_are(failed=1)
+        assert not is_file(f"cassettes/{test.stem}/test_this.yaml")
+        assert not is_file("unrelated.yaml")
+        # both go through the usual deletion, and end up in the manifest
+        manifest = json.loads(
+            (
+                pytester.path / ".pytest_cache" / "v" / "vcr_delete_on_fail" / "deleted"
+            ).read_text()
+        )
+        assert sorted(os.path.basename(cassette) for cassette in manifest) == [
+            "test_this.yaml",
+            "unrelated.yaml",
+        ]
+
+    #
+    #
+    #
+    @pytest.mark.parametrize("chunk_size", [7, 1024 * 1024])
+    def test_should_rewrite_yaml_cassettes_chunk_by_chunk(self, chunk_size, tmp_path):
+        """The prune mode should rewrite yaml cassettes chunk by chunk."""
+        from vcr.persisters.filesystem import FilesystemPersister
+        from vcr.request import Request
+        from vcr.serializers import yamlserializer
+        from pytest_vcr_delete_on_fail.main import prune_yaml_cassette_file
+
+        cassette = str(tmp_path / "cassette.yaml")
+        uris = [f"http://localhost/{i}" for i in range(5)]
+        body = bytes(range(256)) * 10
+        FilesystemPersister.save_cassette(
+            cassette,
+            {
+                "requests": [Request("POST", uri, body, {}) for uri in uris],
+                "responses": [
+                    {
+                        "status": {"code": 200, "message": "OK"},
+                        "headers": {},
+                        "body": {"string": body},
+                    }
+                    for _ in uris
+                ],
+            },
+            serializer=yamlserializer,
+        )
+
+        prune_yaml_cassette_file(cassette, 2, chunk_size=chunk_size)
+
+        requests, responses = FilesystemPersister.load_cassette(
+            cassette, serializer=yamlserializer
+        )
+        assert [request.uri for request in requests] == uris[:2]
+        assert all(request.body == body for request in requests)
+        assert all(response["body"]["string"] == body for response in responses)
+        assert list(tmp_path.iterdir()) == [tmp_path / "cassette.yaml"]
+
+
+# language=python prefix="if True:" # IDE language injection
+slow_remove_conftest = """
+    import os
+    import threading
+    import time
+
+    original_remove = os.remove
+
+    # a high latency filesystem, which refuses to delete broken cassettes
+    def slow_remove(path, *args, **kwargs):
+        if str(path).endswith(".yaml"):
+            time.sleep(0.2)
+            with open("removed_by", "a") as f:
+                f.write(threading.current_thread().name + "\\n")
+            if "broken" in str(path):
+                raise PermissionError(path)
+        return original_remove(path, *args, **kwargs)
+
+    def pytest_configure(config):
+        os.remove = slow_remove
+
+    def pytest_unconfigure(config):
+        os.remove = original_remove
+    """
+
+
+class TestTheBackgroundDeletionMode:
+    """Test: The background deletion mode..."""
+
+    #
+    #
+    #
+    @pytest.mark.parametrize("enabler", ["option", "ini"])
+    def test_should_delete_cassettes_in_background_threads_before_the_session_ends(
+        self, enabler, pytester, add_test_file, test_url, run_tests, is_file
+    ):
+        """The background deletion mode should delete cassettes in background threads before the session ends."""
+        pytester.makeconftest(slow_remove_conftest)
+        # language=python prefix="if True:" # IDE language injection
+        test_source = f"""
+            import pytest
+            import requests
+            import vcr
+
+            my_vcr = vcr.VCR(record_mode="once")
+
+            @pytest.mark.vcr_delete_on_fail("auto")
+            @pytest.mark.parametrize("n", range(4))
+            def test_this(n):
+                with my_vcr.use_cassette(f"cassettes/{{n}}.yaml"):
+                    requests.get("{test_url}")
+                assert False  # intentional
+            """
+        add_test_file(test_source)
+        args = []
+        if enabler == "option":
+            args.append("--vcr-dof-background-workers=2")
+        else:
+            pytester.makeini("[pytest]\nvcr_dof_background_workers = 2")
+        result = run_tests(*args)
+
+        assert result.outcomes_are(failed=4)
+        assert not any(is_file(f"cassettes/{n}.yaml") for n in range(4))
+        threads = (pytester.path / "removed_by").read_text().splitlines()
+        assert len(threads) == 4
+        assert "MainThread" not in threads
+
+    #
+    #
+    #
+    @pytest.mark.parametrize("workers", ["some", "-1"])
+    def test_should_refuse_an_invalid_number_of_workers(
+        self, workers, add_test_file, run_tests, pytester
+    ):
+        """The background deletion mode should refuse an invalid number of workers."""
+        add_test_file("def test_this():\n    pass\n")
+        pytester.makeini(f"[pytest]\nvcr_dof_background_workers = {workers}")
+        result = run_tests()
+
+        assert result.ret == pytest.ExitCode.USAGE_ERROR
+        result.stderr.fnmatch_lines(
+            ["ERROR: vcr_dof_background_workers must be an integer*"]
+        )
+        assert "INTERNALERROR" not in result.stdout.str() + result.stderr.str()
+
+    #
+    #
+    #
+    def test_should_report_deletion_errors_in_the_terminal_summary(
+        self, pytester, add_test_file, test_url, run_tests, is_file
+    ):
+        """The background deletion mode should report deletion errors in the terminal summary."""
+        pytester.makeconftest(slow_remove_conftest)
+        # language=python prefix="if True:" # IDE language injection
+        test_source = f"""
+            import pytest
+            import requests
+            import vcr
+
+            my_vcr = vcr.VCR(record_mode="once")
+
+            @pytest.mark.vcr_delete_on_fail(["cassettes/broken.yaml", "cassettes/working.yaml"])
+            def test_this():
+                for name in ("broken", "working"):
+                    with my_vcr.use_cassette(f"cassettes/{{name}}.yaml"):
+                        requests.get("{test_url}")
+                assert False  # intentional
+            """
+        add_test_file(test_source)
+        result = run_tests("--vcr-dof-background-workers=1")
+
+        assert result.outcomes_are(failed=1)
+        assert is_file("cassettes/broken.yaml")
+        assert not is_file("cassettes/working.yaml")
+        result.stdout.fnmatch_lines(
+            [
+                "*vcr delete on fail deletion errors*",
+                "*broken.yaml: PermissionError(*",
+            ]
+        )
+
+
+class TestTheReRecordBudget:
+    """Test: The re-record budget..."""
+
+    #
+    #
+    #
+    @pytest.mark.parametrize("first_run", [[], ["-n", "1"]])
+    def test_should_report_what_it_takes_to_record_deleted_cassettes_again(
+        self, first_run, pytester, add_test_file, default_conftest, test_url, run_tests
+    ):
+        """The re-record budget should report what it takes to record deleted cassettes again."""
+        if "-n" in first_run:
+            pytest.importorskip("xdist")
+        add_test_file(rerun_test.format(url=test_url))
+        result = run_tests("--vcr-dof-budget", *first_run)
+        assert result.outcomes_are(failed=1, passed=2)
+        result.stdout.fnmatch_lines(
+            [
+                "*vcr delete on fail re-record budget*",
+                "1 cassettes deleted: *KB, 1 interactions, 0.00s to record them again"
+                " (1 without a known recording time)",
+                "costliest cassettes:",
+                "  ? 1 interactions *KB cassettes/*/test_broken.yaml",
+            ]
+        )
+
+        # the broken test gets fixed: it records its cassette again, and how long it took is learned
+        (pytester.path / "fixed").touch()
+        assert run_tests("--vcr-dof-budget", *first_run).outcomes_are(passed=3)
+        (pytester.path / "fixed").unlink()
+        result = run_tests("--vcr-dof-budget", *first_run)
+        assert result.outcomes_are(failed=1, passed=2)
+        result.stdout.fnmatch_lines(
+            [
+                "1 cassettes deleted: *KB, 1 interactions, *s to record them again",
+                "  *s 1 interactions *KB cassettes/*/test_broken.yaml",
+            ]
+        )
+        result.stdout.no_fnmatch_line("*without a known recording time*")
+
+    #
+    #
+    #
+    @pytest.mark.parametrize("chunk_size", [7, 1024 * 1024])
+    def test_should_count_yaml_cassettes_interactions_chunk_by_chunk(
+        self, chunk_size, tmp_path
+    ):
+        """The re-record budget should count yaml cassettes interactions chunk by chunk."""
+        from vcr.persisters.filesystem import FilesystemPersister
+        from vcr.request import Request
+        from vcr.serializers import yamlserializer
+        from pytest_vcr_delete_on_fail.main import count_yaml_cassette_interactions
+
+        cassette = str(tmp_path / "cassette.yaml")
+        uris = [f"http://localhost/{i}" for i in range(5)]
+        FilesystemPersister.save_cassette(
+            cassette,
+            {
+                "requests": [Request("GET", uri, None, {}) for uri in uris],
+                "responses": [
+                    {
+                        "status": {"code": 200, "message": "OK"},
+                        "headers": {},
+                        "body": {"string": b"- not a new interaction\n" * 10},
+                    }
+                    for _ in uris
+                ],
+            },
+            serializer=yamlserializer,
+        )
+
+        assert count_yaml_cassette_interactions(cassette, chunk_size=chunk_size) == 5
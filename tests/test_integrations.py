@@ -1,3 +1,6 @@
+import pytest
+
+
 #
 #
 #
@@ -266,3 +269,110 @@ def test_it_should_support_setup_logic_via_our_context_manager(
 
     assert run_tests().outcomes_are(errors=1)
     assert not get_test_cassettes(test)
+
+
+#
+#
+#
+def test_it_should_delete_the_cassette_where_pytest_recording_saved_it(
+    add_test_file, test_url, run_tests, pytester, get_test_cassettes
+):
+    """It should delete the cassette where pytest-recording saved it"""
+    # language=python prefix="if True:" # IDE language injection
+    test_source = f"""
+        import os
+        import pytest
+        import requests
+
+        @pytest.fixture(scope="module")
+        def vcr_config():
+            return {{"record_mode": "once", "serializer": "json"}}
+
+        @pytest.fixture
+        def vcr_cassette_dir(request):
+            return os.path.join(str(request.config.rootpath), "recorded")
+
+        @pytest.mark.vcr
+        @pytest.mark.vcr_delete_on_fail
+        def test_passing():
+            requests.get("{test_url}")
+
+        @pytest.mark.vcr
+        @pytest.mark.vcr_delete_on_fail
+        @pytest.mark.default_cassette("custom")
+        def test_failing():
+            requests.get("{test_url}")
+            assert False  # intentional
+        """
+    test = add_test_file(test_source)
+
+    assert run_tests().outcomes_are(passed=1, failed=1)
+    assert [path.name for path in (pytester.path / "recorded").iterdir()] == [
+        "test_passing.json"
+    ]
+    assert not get_test_cassettes(test)
+
+
+#
+#
+#
+def test_it_should_only_consider_the_last_attempt_with_pytest_rerunfailures(
+    add_test_file, run_tests, is_file
+):
+    """It should only consider the last attempt with pytest-rerunfailures"""
+    pytest.importorskip("pytest_rerunfailures")
+    # language=python prefix="if True:" # IDE language injection
+    test_source = """
+        import os
+        import pytest
+        from pytest_vcr_delete_on_fail import has_class_scoped_setup_failed
+
+        def first_attempt(name):
+            # every test writes its cassette, then fails only the first time it runs
+            os.makedirs("cassettes", exist_ok=True)
+            open(f"cassettes/{name}.yaml", "w").close()
+            if os.path.exists(name):
+                return False
+            open(name, "w").close()
+            return True
+
+        @pytest.mark.vcr_delete_on_fail("cassettes/flaky.yaml")
+        def test_flaky():
+            assert not first_attempt("flaky")  # intentional
+
+        @pytest.mark.vcr_delete_on_fail("cassettes/broken.yaml")
+        def test_broken():
+            first_attempt("broken")
+            assert False  # intentional
+
+        @pytest.fixture
+        def skipped_on_rerun():
+            if os.path.exists("skipped"):
+                pytest.skip()
+
+        @pytest.mark.vcr_delete_on_fail("cassettes/skipped.yaml")
+        def test_skipped_on_rerun(skipped_on_rerun):
+            assert not first_attempt("skipped")  # intentional
+
+        @pytest.mark.vcr_delete_on_fail("cassettes/flaky_class.yaml")
+        class TestFlakyClass:
+            @pytest.fixture(scope="class", autouse=True)
+            def setup_phase(self):
+                assert not first_attempt("flaky_class")  # intentional
+
+            def test_this(self):
+                pass
+
+        def test_class_tags(request):
+            flaky_class_test = next(item for item in request.session.items if item.cls is TestFlakyClass)
+            assert not has_class_scoped_setup_failed(flaky_class_test)
+        """
+    add_test_file(test_source)
+    result = run_tests("--reruns", "1")
+
+    assert result.outcomes_are(passed=3, failed=1, skipped=1)
+    assert result.parseoutcomes()["rerun"] == 4
+    assert is_file("cassettes/flaky.yaml")
+    assert is_file("cassettes/skipped.yaml")
+    assert is_file("cassettes/flaky_class.yaml")
+    assert not is_file("cassettes/broken.yaml")
@@ -0,0 +1,247 @@
+import os
+import threading
+import time
+
+import pytest
+
+
+class TestTheTargetCallables:
+    """Test: The target callables..."""
+
+    #
+    #
+    #
+    @pytest.mark.parametrize("enabler", ["option", "ini"])
+    def test_should_be_evaluated_concurrently_when_using_workers(
+        self, enabler, pytester, add_test_file, run_tests, is_file
+    ):
+        """The target callables should be evaluated concurrently when using workers."""
+        # language=python prefix="if True:" # IDE language injection
+        test_source = """
+            import threading
+            import pytest
+
+            # every callable waits for all the others: this only works if they run concurrently
+            barrier = threading.Barrier(3, timeout=5)
+
+            def make_target(name):
+                def target(item):
+                    barrier.wait()
+                    return name
+                return target
+
+            @pytest.fixture
+            def cassettes():
+                for name in ["a.yaml", "b.yaml", "c.yaml"]:
+                    open(name, "w").close()
+
+            @pytest.mark.vcr_delete_on_fail([make_target("a.yaml"), make_target("b.yaml"), make_target("c.yaml")])
+            def test_this(cassettes):
+                assert False
+            """
+        add_test_file(test_source)
+        args = []
+        if enabler == "option":
+            args.append("--vcr-dof-target-workers=3")
+        else:
+            pytester.makeini("[pytest]\nvcr_dof_target_workers = 3")
+        result = run_tests(*args)
+        assert result.outcomes_are(failed=1)
+        assert "TargetCallableWarning" not in result.stdout.str()
+        assert not is_file("a.yaml")
+        assert not is_file("b.yaml")
+        assert not is_file("c.yaml")
+
+    #
+    #
+    #
+    def test_should_be_abandoned_and_reported_when_timing_out(
+        self, add_test_file, run_tests, is_file
+    ):
+        """The target callables should be abandoned and reported when timing out."""
+        # language=python prefix="if True:" # IDE language injection
+        test_source = """
+            import threading
+            import pytest
+
+            def hung(item):
+                threading.Event().wait()
+
+            def nested(item):
+                return ["b.yaml", hung]
+
+            @pytest.fixture
+            def cassettes():
+                for name in ["a.yaml", "b.yaml"]:
+                    open(name, "w").close()
+
+            @pytest.mark.vcr_delete_on_fail(["a.yaml", hung, nested])
+            def test_this(cassettes):
+                assert False
+            """
+        add_test_file(test_source)
+        result = run_tests("--vcr-dof-target-timeout=0.2", "--vcr-dof-target-workers=2")
+        assert result.outcomes_are(failed=1)
+        result.stdout.fnmatch_lines(
+            ["*TargetCallableWarning*hung timed out after 0.2s*"]
+        )
+        # hung is called twice: by the marker and by nested
+        assert result.parseoutcomes()["warnings"] == 2
+        # the cassettes found by the other targets are deleted anyway
+        assert not is_file("a.yaml")
+        assert not is_file("b.yaml")
+
+    #
+    #
+    #
+    def test_should_start_the_timeout_when_a_worker_picks_them_up(self):
+        """The target callables should start the timeout when a worker picks them up."""
+        from pytest_vcr_delete_on_fail.main import TargetEvaluator
+
+        def slow(item):
+            time.sleep(0.3)
+            return "a.yaml"
+
+        evaluator = TargetEvaluator(workers=2, timeout=0.5)
+        # the last two callables wait in the queue for longer than the timeout, without overrunning it
+        results = evaluator.evaluate([slow, slow, slow, slow], None)
+        evaluator.shutdown()
+        assert [error for _, _, error in results] == [None] * 4
+
+    #
+    #
+    #
+    def test_should_keep_the_pool_bounded_when_timing_out(self):
+        """The target callables should keep the pool bounded when timing out."""
+        from pytest_vcr_delete_on_fail.main import TargetEvaluator
+
+        release = threading.Event()
+
+        def stuck(item):
+            release.wait(5)
+
+        evaluator = TargetEvaluator(workers=2, timeout=0.05)
+        before = threading.active_count()
+        for _ in range(5):
+            results = evaluator.evaluate([stuck, stuck], None)
+            assert all(error is not None for _, _, error in results)
+        # the abandoned workers leave the pool as soon as their callables return
+        release.set()
+        deadline = time.monotonic() + 5
+        while threading.active_count() > before + 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert threading.active_count() == before + 2
+        evaluator.shutdown()
+
+    #
+    #
+    #
+    @pytest.mark.parametrize(
+        "ini,error",
+        [
+            (
+                "vcr_dof_target_timeout = soon",
+                "vcr_dof_target_timeout must be a number, got 'soon'",
+            ),
+            (
+                "vcr_dof_target_timeout = -1",
+                "vcr_dof_target_timeout must be a number >= 0.0, got '-1'",
+            ),
+            (
+                "vcr_dof_target_workers = many",
+                "vcr_dof_target_workers must be an integer, got 'many'",
+            ),
+            (
+                "vcr_dof_target_workers = 0",
+                "vcr_dof_target_workers must be an integer >= 1, got '0'",
+            ),
+        ],
+    )
+    def test_should_refuse_invalid_options(
+        self, ini, error, add_test_file, run_tests, pytester
+    ):
+        """The target callables should refuse invalid options."""
+        add_test_file("def test_this():\n    pass\n")
+        pytester.makeini(f"[pytest]\n{ini}")
+        result = run_tests()
+
+        assert result.ret == pytest.ExitCode.USAGE_ERROR
+        result.stderr.fnmatch_lines([f"ERROR: {error}"])
+        assert "INTERNALERROR" not in result.stdout.str() + result.stderr.str()
+
+
+class TestTheTargetPatterns:
+    """Test: The target patterns..."""
+
+    #
+    #
+    #
+    def test_should_delete_every_matching_cassette(
+        self, add_test_file, run_tests, pytester
+    ):
+        """The target patterns should delete every matching cassette."""
+        # language=python prefix="if True:" # IDE language injection
+        test_source = """
+            import pytest
+            from pytest_vcr_delete_on_fail import Glob, Regex
+
+            @pytest.mark.vcr_delete_on_fail([Glob("cassettes/test_x[[]1]*.yaml*")])
+            def test_glob():
+                assert False  # intentional
+
+            @pytest.mark.vcr_delete_on_fail([Regex("cassettes", r"test_y\\.yaml\\.(enc|clear)")])
+            def test_regex():
+                assert False  # intentional
+            """
+        add_test_file(test_source)
+        folder = pytester.mkdir("cassettes")
+        names = [
+            "test_x[1].yaml",
+            "test_x[1].yaml.enc",
+            "test_x[1]_other.yaml",
+            "test_x[2].yaml",
+            "test_y.yaml.enc",
+            "test_y.yaml.clear",
+            "test_y.yaml",
+        ]
+        for name in names:
+            (folder / name).write_text("")
+        assert run_tests().outcomes_are(failed=2)
+        assert sorted(path.name for path in folder.iterdir()) == [
+            "test_x[2].yaml",
+            "test_y.yaml",
+        ]
+
+    #
+    #
+    #
+    def test_should_list_a_folder_once_for_many_patterns(
+        self, request, tmp_path, monkeypatch
+    ):
+        """The target patterns should list a folder once for many patterns."""
+        from pytest_vcr_delete_on_fail import Glob
+        from pytest_vcr_delete_on_fail.main import parse_target
+
+        for i in range(100):
+            (tmp_path / f"test_{i}.yaml").write_text("")
+        patterns = [Glob(str(tmp_path / f"test_{i}.yaml*")) for i in range(100)]
+        listed = []
+        scandir = os.scandir
+        monkeypatch.setattr(
+            os, "scandir", lambda path: listed.append(path) or scandir(path)
+        )
+
+        cassettes = parse_target(patterns, request.node)
+
+        assert len(cassettes) == 100
+        assert len(listed) == 1
+
+    #
+    #
+    #
+    def test_should_only_accept_wildcards_in_the_file_name(self):
+        """The target patterns should only accept wildcards in the file name."""
+        from pytest_vcr_delete_on_fail import Glob
+
+        with pytest.raises(ValueError):
+            Glob("cassettes/*/test.yaml")
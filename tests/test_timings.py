@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+# language=python prefix="if True:" # IDE language injection
+timed_test = """
+    import pytest
+    import requests
+
+    def additional(item):
+        return f"cassettes/{{item.name}}_additional.yaml"
+
+    @pytest.mark.vcr
+    @pytest.mark.vcr_delete_on_fail(additional, delete_default=True)
+    def test_failing():
+        requests.get("{url}")
+        assert False  # intentional
+
+    def test_passing():
+        pass
+    """
+
+
+class TestTheTimings:
+    """Test: The timings..."""
+
+    #
+    #
+    #
+    def test_should_not_be_reported_by_default(
+        self, add_test_file, default_conftest, test_url, run_tests
+    ):
+        """The timings should not be reported by default."""
+        add_test_file(timed_test.format(url=test_url))
+        result = run_tests()
+        assert result.outcomes_are(failed=1, passed=1)
+        assert "vcr delete on fail timings" not in result.stdout.str()
+
+    #
+    #
+    #
+    def test_should_be_reported_in_the_terminal_summary(
+        self, add_test_file, default_conftest, test_url, run_tests
+    ):
+        """The timings should be reported in the terminal summary."""
+        add_test_file(timed_test.format(url=test_url))
+        result = run_tests("--vcr-dof-timings")
+        assert result.outcomes_are(failed=1, passed=1)
+        result.stdout.fnmatch_lines(
+            ["*vcr delete on fail timings*", "slowest tests:", "*test_failing"]
+        )
+        for line in [
+            "pytest_collection_modifyitems: 1 calls, *",
+            "pytest_runtest_makereport: 3 calls, *p50*p99*",
+            "pytest_runtest_protocol: 1 calls, *",
+            "target callables: 1 calls, *",
+            "cassette deletion: 2 calls, *",
+        ]:
+            result.stdout.fnmatch_lines([line])
+
+    #
+    #
+    #
+    def test_should_be_dumped_into_a_json_file(
+        self, pytester, add_test_file, default_conftest, test_url, run_tests
+    ):
+        """The timings should be dumped into a json file."""
+        test = add_test_file(timed_test.format(url=test_url))
+        result = run_tests("--vcr-dof-timings-json=timings.json")
+        assert result.outcomes_are(failed=1, passed=1)
+        timings = json.loads((pytester.path / "timings.json").read_text())
+        assert timings["categories"]["pytest_runtest_protocol"]["count"] == 1
+        assert timings["categories"]["cassette deletion"]["count"] == 2
+        # tests not using the marker are skipped by the plugin right away, so they are not measured
+        assert list(timings["items"]) == [f"{test.name}::test_failing"]
+
+    #
+    #
+    #
+    def test_should_collect_pytest_xdist_workers_timings(
+        self, add_test_file, default_conftest, test_url, run_tests
+    ):
+        """The timings should collect pytest-xdist workers timings."""
+        pytest.importorskip("xdist")
+        add_test_file(timed_test.format(url=test_url))
+        result = run_tests("--vcr-dof-timings", "-n", "2")
+        assert result.outcomes_are(failed=1, passed=1)
+        result.stdout.fnmatch_lines(["*vcr delete on fail timings*"])
+        result.stdout.fnmatch_lines(["pytest_runtest_protocol: 1 calls, *"])
+        # the controller deletes the (existing) cassettes in bulk
+        result.stdout.fnmatch_lines(["cassette deletion: 1 calls, *"])